@@ -0,0 +1,291 @@
+# IMPORTS
+import os
+import csv
+import copy
+import math
+import time
+import argparse
+import itertools
+import multiprocessing
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame as py
+import new_main as game
+
+# CONSTANTS
+# five minutes of game time, runs the bot survives that long are cut off
+MAX_TICKS = 5 * 60 * game.FPS
+SEEDS = 4
+# name -> values tried, every combination is played once per seed
+DEFAULT_GRID = {
+    "spawn_scale": [0.5, 1.0, 2.0],
+    "strong_enemy_v": [3, 4, 5],
+    "player_ammo": [3, 5, 8],
+    "invulnerability_time": [1, 3],
+}
+# the game's own values, the bot is checked against a player that does nothing with these before a sweep
+BASELINE = {"spawn_scale": 1.0, "strong_enemy_v": game.STRONG_ENEMY_V, "player_ammo": game.PLAYER_AMMO,
+            "invulnerability_time": game.INVULNERABILITY_TIME}
+# the bot has to survive at least this many times as long as the idle player, or the sweep only measures it failing
+BOT_MARGIN = 2.0
+CHECK_SEEDS = 8
+# ticks ahead the bot looks when weighing each move, enemies closer than SAFE_DISTANCE by then count as danger
+LOOKAHEAD = 4
+SAFE_DISTANCE = 2 * game.IMAGE_SIZE
+# fires when an enemy's centre is ahead of it and within this many pixels of its own row
+AIM_TOLERANCE = 12
+# (dx, dy) of every arrow combination, standing still included
+MOVES = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+MOVE_KEYS = {(dx, dy): game.KeyState(([py.K_LEFT] if dx < 0 else [py.K_RIGHT] if dx > 0 else [])
+                                     + ([py.K_UP] if dy < 0 else [py.K_DOWN] if dy > 0 else []))
+             for dx, dy in MOVES}
+# runs timed with one worker and with all of them
+TIMING_RUNS = 8
+COLUMNS = ["spawn_scale", "strong_enemy_v", "player_ammo", "invulnerability_time", "seed", "ticks", "survived_s",
+           "score", "shots", "peak_entities", "mean_tick_us"]
+
+
+# SUBPROGRAMS
+# parameters
+def scaled_waves(waves, scale):
+    # every repeating spawn comes scale times less often, skip rules are scaled with it so the pattern holds
+    waves = copy.deepcopy(waves)
+    for repeat in waves["repeat"]:
+        repeat["every"] *= scale
+        if "start" in repeat:
+            repeat["start"] *= scale
+        if "except_every" in repeat:
+            repeat["except_every"] = [every * scale for every in repeat["except_every"]]
+    return waves
+
+
+def apply_params(params):
+    # the tunables are module constants and class attributes read when a game is built or ticks, returns the values
+    # they replaced for restore_params once the run is over
+    saved = (game.PLAYER_AMMO, game.INVULNERABILITY_TIME, game.StrongerEnemy.speed)
+    game.PLAYER_AMMO = params["player_ammo"]
+    game.INVULNERABILITY_TIME = params["invulnerability_time"]
+    game.StrongerEnemy.speed = params["strong_enemy_v"]
+    return saved
+
+
+def restore_params(saved):
+    game.PLAYER_AMMO, game.INVULNERABILITY_TIME, game.StrongerEnemy.speed = saved
+
+
+def grid_runs(grid, seeds):
+    names = list(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        for seed in range(seeds):
+            yield dict(zip(names, values), seed=seed)
+
+
+# bots
+def aim_bot(g):
+    # takes whichever move leaves it furthest from where the enemies could be in LOOKAHEAD ticks and from the walls,
+    # with nothing close it lines up with the nearest enemy's row, and it fires whenever an enemy is ahead in line
+    player = g.player.rect
+    if g.swarm is not None and len(g.swarm):
+        positions = g.swarm.pos[:len(g.swarm)].tolist()
+    else:
+        positions = [enemy.rect.topleft for enemy in g.enemies]
+    half = game.IMAGE_SIZE // 2
+    px, py_ = player.centerx, player.centery
+    centres = [(x + half, y + half) for x, y in positions]
+    shots = 0
+    nearest = None
+    for x, y in centres:
+        # enemies waiting off the right edge can't be shot or lined up with yet
+        if x > game.SCREEN_WIDTH:
+            continue
+        if x > px and abs(y - py_) < AIM_TOLERANCE:
+            shots = 1
+        distance = abs(x - px) + abs(y - py_)
+        if nearest is None or distance < nearest[0]:
+            nearest = (distance, y)
+    step = g.player.v * LOOKAHEAD
+    # every enemy is assumed as fast as the fastest kind
+    reach = game.StrongerEnemy.speed * LOOKAHEAD
+    best = None
+    for dx, dy in MOVES:
+        x = min(max(px + dx * step, half), game.SCREEN_WIDTH - half)
+        y = min(max(py_ + dy * step, half), game.SCREEN_HEIGHT - half)
+        cost = 0.0
+        for ex, ey in centres:
+            gap = math.hypot(ex - x, ey - y) - reach
+            if gap < SAFE_DISTANCE:
+                cost += (SAFE_DISTANCE - gap) ** 2
+        # walls and corners leave nowhere to go next
+        for gap in (x - half, game.SCREEN_WIDTH - half - x, y - half, game.SCREEN_HEIGHT - half - y):
+            if gap < SAFE_DISTANCE:
+                cost += (SAFE_DISTANCE - gap) ** 2 / 2
+        if nearest is not None:
+            cost += abs(y - nearest[1]) * 2
+        if best is None or cost < best[0]:
+            best = (cost, (dx, dy))
+    return MOVE_KEYS[best[1]], shots
+
+
+def idle_bot(g):
+    # never moves or fires, what the aim bot is checked against
+    return MOVE_KEYS[0, 0], 0
+
+
+# runs
+def play(params, max_ticks=MAX_TICKS, numpy_enemies=False, bot=aim_bot):
+    # one seeded game with these parameters, returns a row for the results table
+    # the parameters are put back afterwards, runs in this process and anything else using new_main see the defaults
+    saved = apply_params(params)
+    try:
+        g = game.Game(seed=params["seed"], numpy_enemies=numpy_enemies, simulate_only=True)
+        g.waves = scaled_waves(g.waves, params["spawn_scale"])
+        g.reset()
+        return {**params, **play_game(g, max_ticks, bot)}
+    finally:
+        restore_params(saved)
+
+
+def play_game(g, max_ticks, bot):
+    ticks = 0
+    peak = 0
+    fired = 0
+    elapsed = 0.0
+    while ticks < max_ticks:
+        keys, shots = bot(g)
+        fired += min(shots, g.player.get_ammo())
+        start = time.perf_counter()
+        alive = g.update(keys, shots)
+        elapsed += time.perf_counter() - start
+        ticks += 1
+        entities = len(g.enemies) + len(g.projectiles) + (len(g.swarm) if g.swarm is not None else 0)
+        peak = max(peak, entities)
+        if not alive:
+            break
+    return {"ticks": ticks, "survived_s": ticks / game.FPS, "score": g.score, "shots": fired, "peak_entities": peak,
+            "mean_tick_us": elapsed / ticks * 1e6}
+
+
+def play_star(args):
+    return play(*args)
+
+
+def run_batch(grid=DEFAULT_GRID, seeds=SEEDS, workers=None, max_ticks=MAX_TICKS, numpy_enemies=False, bot=aim_bot,
+              limit=None):
+    # one process per core by default, runs are handed out a few at a time so slow and fast ones even out
+    # limit only plays the first that many runs of the grid
+    jobs = [(params, max_ticks, numpy_enemies, bot) for params in itertools.islice(grid_runs(grid, seeds), limit)]
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        return [play_star(job) for job in jobs]
+    # close and join rather than the pool's context manager, that terminates the workers with SIGTERM which SDL
+    # catches and turns into a QUIT event, leaving the join waiting forever
+    pool = multiprocessing.Pool(workers)
+    try:
+        return list(pool.imap_unordered(play_star, jobs, chunksize=max(1, len(jobs) // (workers * 8))))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def check_bot(seeds=CHECK_SEEDS, workers=None, max_ticks=MAX_TICKS, numpy_enemies=False):
+    # mean survival in seconds of the aim bot and of the idle player over the same seeds with the game's own values
+    grid = {name: [value] for name, value in BASELINE.items()}
+    return [mean([row["survived_s"] for row in run_batch(grid, seeds, workers, max_ticks, numpy_enemies, bot)])
+            for bot in (aim_bot, idle_bot)]
+
+
+def time_workers(grid, seeds, workers, max_ticks=MAX_TICKS, numpy_enemies=False, runs=TIMING_RUNS):
+    # seconds to play the grid's first runs with one worker and with workers
+    timings = []
+    for count in (1, workers):
+        start = time.perf_counter()
+        run_batch(grid, seeds, count, max_ticks, numpy_enemies, limit=runs)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def write_csv(rows, path):
+    rows = sorted(rows, key=lambda row: [row[column] for column in COLUMNS[:5]])
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def summarise(rows, grid):
+    # mean survival, score and shots fired over the seeds of each parameter combination, longest survival first
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row[name] for name in grid), []).append(row)
+    summary = []
+    for key, group in groups.items():
+        summary.append((key, mean([row["survived_s"] for row in group]), mean([row["score"] for row in group]),
+                        mean([row["shots"] for row in group])))
+    return sorted(summary, key=lambda item: -item[1])
+
+
+def sensitivity(rows, grid):
+    # name -> [(value, mean survival over every run with that value)], a parameter whose means are all the same
+    # isn't changing anything the bot runs into
+    result = {}
+    for name, values in grid.items():
+        result[name] = [(value, mean([row["survived_s"] for row in rows if row[name] == value])) for value in values]
+    return result
+
+
+def mean(values):
+    return sum(values) / len(values)
+
+
+def parse_grid(specs):
+    # "name=1,2,3" per parameter, anything not given keeps its default values
+    grid = dict(DEFAULT_GRID)
+    for spec in specs:
+        name, values = spec.split("=")
+        if name not in DEFAULT_GRID:
+            raise SystemExit(f"unknown parameter {name}, expected one of {', '.join(DEFAULT_GRID)}")
+        grid[name] = [float(value) if "." in value else int(value) for value in values.split(",")]
+    return grid
+
+
+# MAIN
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="play seeded headless games over a grid of tuning constants")
+    parser.add_argument("--grid", nargs="*", default=[], help="e.g. player_ammo=3,5 spawn_scale=0.5,1.0")
+    parser.add_argument("--seeds", type=int, default=SEEDS, help="games per parameter combination")
+    parser.add_argument("--workers", type=int, help="processes to use, one per core if not given")
+    parser.add_argument("--max-ticks", type=int, default=MAX_TICKS)
+    parser.add_argument("--numpy-enemies", action="store_true")
+    parser.add_argument("--output", default="batch_results.csv")
+    args = parser.parse_args()
+
+    grid = parse_grid(args.grid)
+    workers = args.workers or os.cpu_count()
+    bot, idle = check_bot(CHECK_SEEDS, workers, args.max_ticks, args.numpy_enemies)
+    print(f"with the game's own values the bot survives {bot:.1f} s, a player that does nothing {idle:.1f} s "
+          f"({bot / idle:.1f}x)")
+    if bot < idle * BOT_MARGIN:
+        raise SystemExit(f"the bot doesn't survive {BOT_MARGIN}x as long as doing nothing, a sweep would mostly "
+                         f"measure it failing")
+    if workers > 1:
+        serial, parallel = time_workers(grid, args.seeds, workers, args.max_ticks, args.numpy_enemies)
+        print(f"first {TIMING_RUNS} runs: {serial:.1f} s on 1 worker, {parallel:.1f} s on {workers} "
+              f"({serial / parallel:.1f}x)")
+    else:
+        print("one worker, pass --workers to time it against one")
+    start = time.perf_counter()
+    rows = run_batch(grid, args.seeds, workers, args.max_ticks, args.numpy_enemies)
+    seconds = time.perf_counter() - start
+    write_csv(rows, args.output)
+    ticks = sum(row["ticks"] for row in rows)
+    print(f"{len(rows)} games, {ticks} ticks in {seconds:.1f} s on {workers} workers "
+          f"({ticks / seconds:.0f} ticks/s), results in {args.output}")
+    for name, means in sensitivity(rows, grid).items():
+        if len(means) < 2:
+            continue
+        spread = max(survived for _, survived in means) - min(survived for _, survived in means)
+        print(f"{name}: " + ", ".join(f"{value} -> {survived:.1f} s" for value, survived in means)
+              + ("  NO EFFECT" if spread == 0 else f" (spread {spread:.1f} s)"))
+    for key, survived, score, shots in summarise(rows, grid)[:10]:
+        print(", ".join(f"{name} {value}" for name, value in zip(grid, key)) +
+              f": survived {survived:.1f} s, score {score:.1f}, {shots:.0f} shots")
@@ -0,0 +1,437 @@
+# IMPORTS
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import array
+import platform
+import subprocess
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame as py
+import new_main as game
+from profiler import FrameProfiler
+from particles import ParticleSystem
+from scheduler import TimerWheel
+
+# CONSTANTS
+FRAMES = 300
+BUBBLE_COUNTS = [15, 1000, 5000]
+STRESS_COUNTS = [100, 1000, 10000]
+STRESS_FRAMES = 60
+COLLISION_COUNTS = [100, 1000, 5000]
+REGRESSION_THRESHOLD = 1.10
+# the mask narrow phase is meant to cost no more than this many times the rect-only collisions
+MASK_COST_TARGET = 1.25
+# each collision mode is timed this many times, alternating, and the fastest kept so one noisy run can't decide it
+COLLISION_REPEATS = 3
+STARTUP_RUNS = 5
+SCHEDULER_PENDING = [100, 10000, 1000000]
+SCHEDULER_TICKS = 10000
+SOAK_RESTARTS = 300
+CHECK_TICKS = 600
+SOAK_WARMUP = 20
+# traced memory may grow this much between the end of the warmup and the last restart
+SOAK_MAX_GROWTH_KB = 256
+# run in a fresh interpreter so imports and pygame init are part of the time
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+import new_main
+g = new_main.Game(headless=True)
+g.draw()
+print((time.perf_counter() - start) * 1000)
+"""
+
+
+# SUBPROGRAMS
+# background before/after the static layer was baked
+def legacy_background_draw(background, screen):
+    # what OceanBackground.draw did before the static layer and the waves were baked
+    screen.blit(background.gradient_surface, (0, 0))
+    background.draw_light_beams(screen)
+    wave_surface = py.Surface((background.width, game.WAVE_HEIGHT), py.SRCALPHA)
+    background.render_wave(wave_surface, background.wave_phase)
+    background.wave_phase += background.wave_speed
+    screen.blit(wave_surface, (0, 0))
+    background.bubbles.update()
+    background.bubbles.draw(screen)
+
+
+def tick_and_draw(background, screen):
+    # one tick per frame, as the game does at 30 frames a second
+    background.tick()
+    background.draw(screen)
+
+
+def time_frames(draw, background, screen, frames):
+    start = time.perf_counter()
+    for _ in range(frames):
+        draw(background, screen)
+    return (time.perf_counter() - start) / frames * 1000
+
+
+def bench_background(frames=FRAMES):
+    py.init()
+    screen = py.display.set_mode((game.SCREEN_WIDTH, game.SCREEN_HEIGHT))
+    background = game.OceanBackground(game.SCREEN_WIDTH, game.SCREEN_HEIGHT)
+    before = time_frames(legacy_background_draw, background, screen, frames)
+    background = game.OceanBackground(game.SCREEN_WIDTH, game.SCREEN_HEIGHT)
+    after = time_frames(tick_and_draw, background, screen, frames)
+    return {"before_ms": before, "after_ms": after}
+
+
+# bubbles before/after the particle system
+def legacy_bubbles(count, width, height, rng):
+    return [{'x': rng.randint(50, width - 50), 'y': rng.randint(height - 100, height - 10),
+             'radius': rng.randint(3, 8), 'speed': rng.uniform(0.5, 1.5)} for _ in range(count)]
+
+
+def legacy_bubbles_draw(bubbles, screen, rng):
+    # the per-bubble dict update and py.draw.circle loop ParticleSystem replaced
+    width, height = screen.get_size()
+    for bubble in bubbles:
+        bubble['y'] -= bubble['speed']
+        if bubble['y'] + bubble['radius'] < 0:
+            bubble['x'] = rng.randint(50, width - 50)
+            bubble['y'] = height + rng.randint(5, 50)
+            bubble['radius'] = rng.randint(3, 8)
+            bubble['speed'] = rng.uniform(0.5, 1.5)
+    for bubble in bubbles:
+        py.draw.circle(screen, game.BUBBLE_COLOUR, (int(bubble['x']), int(bubble['y'])), bubble['radius'], 2)
+
+
+def bench_bubbles(counts=BUBBLE_COUNTS, frames=FRAMES):
+    py.init()
+    screen = py.display.set_mode((game.SCREEN_WIDTH, game.SCREEN_HEIGHT))
+    results = []
+    for count in counts:
+        rng = random.Random(0)
+        bubbles = legacy_bubbles(count, game.SCREEN_WIDTH, game.SCREEN_HEIGHT, rng)
+        start = time.perf_counter()
+        for _ in range(frames):
+            legacy_bubbles_draw(bubbles, screen, rng)
+        before = (time.perf_counter() - start) / frames * 1000
+        particles = ParticleSystem(count, game.SCREEN_WIDTH, game.SCREEN_HEIGHT, game.BUBBLE_COLOUR, seed=0)
+        start = time.perf_counter()
+        for _ in range(frames):
+            particles.update()
+            particles.draw(screen)
+        after = (time.perf_counter() - start) / frames * 1000
+        results.append({"count": count, "before_ms": before, "after_ms": after})
+    return results
+
+
+# event scheduler
+def bench_scheduler(pending_counts=SCHEDULER_PENDING, ticks=SCHEDULER_TICKS):
+    # firing cost per tick with that many events spread over ten times the run, most of them far in the future
+    rng = random.Random(0)
+    results = []
+    for pending in pending_counts:
+        wheel = TimerWheel()
+        start = time.perf_counter()
+        for i in range(pending):
+            wheel.schedule(rng.randrange(ticks * 10), i)
+        schedule_us = (time.perf_counter() - start) / pending * 1e6
+        fired = 0
+        start = time.perf_counter()
+        for tick in range(ticks):
+            fired += len(wheel.advance(tick))
+        per_tick = (time.perf_counter() - start) / ticks * 1e6
+        results.append({"pending": pending, "schedule_us": schedule_us, "tick_us": per_tick,
+                        "fired_per_tick": fired / ticks})
+    return results
+
+
+# restarts
+def stack_depth():
+    frame = sys._getframe(1)
+    depth = 0
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
+
+
+def soak_restarts(restarts=SOAK_RESTARTS, enemies=50, numpy_enemies=False):
+    # plays start -> play -> game over -> play ... through Game.run_frame with posted key presses, stack depth and
+    # traced memory should stay flat however many restarts there are
+    g = game.Game(headless=True, seed=0, defer_gameplay=True, quality=0, numpy_enemies=numpy_enemies)
+    g.enter_scene(game.SCENE_START)
+    # only scene changes made by the loop are measured, results go in preallocated storage (an int array for the
+    # memory readings) so the measurements are not counted as growth themselves
+    depths = [sys.maxsize, 0]
+    enter_scene = g.enter_scene
+
+    def tracked_enter_scene(scene):
+        depth = stack_depth()
+        depths[0] = min(depths[0], depth)
+        depths[1] = max(depths[1], depth)
+        enter_scene(scene)
+
+    g.enter_scene = tracked_enter_scene
+    memory = array.array("q", bytes(8 * restarts))
+    tracemalloc.start()
+    for restart in range(restarts):
+        py.event.post(py.event.Event(py.KEYDOWN, key=py.K_RETURN))
+        g.run_frame()
+        for i in range(enemies):
+            g.spawn_enemy(g.enemy_kinds[i % len(g.enemy_kinds)])
+        for _ in range(game.PLAYER_AMMO):
+            g.shoot()
+        g.player.health = 0
+        # one tick due straight away rather than after a real 1 / FPS seconds
+        g.lag = 1 / game.FPS
+        g.run_frame()
+        if g.scene != game.SCENE_GAME_OVER:
+            raise RuntimeError(f"restart {restart} ended in the {g.scene} scene")
+        memory[restart] = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    growth = (memory[-1] - memory[min(SOAK_WARMUP, len(memory) - 1)]) / 1024
+    return {"restarts": restarts, "stack_depth": depths, "memory_kb": memory[-1] / 1024, "growth_kb": growth,
+            "leaked": growth > SOAK_MAX_GROWTH_KB or depths[0] != depths[1]}
+
+
+# the spatial hash against the brute force reference
+def game_state(g):
+    return (g.score, g.player.get_health(), g.player.get_ammo(), g.player.rect.topleft,
+            [(enemy.rect.topleft, enemy.get_health()) for enemy in g.enemies],
+            [projectile.rect.topleft for projectile in g.projectiles])
+
+
+def check_grid_collisions(ticks=CHECK_TICKS, enemies=200, seed=0):
+    # the same seeded game played with the grid and with brute force has to match tick for tick
+    games = [build_stress_game(enemies, seed, brute_force_collisions=brute_force) for brute_force in (False, True)]
+    inputs = game.bot_inputs()
+    for tick in range(ticks):
+        keys, shots = next(inputs)
+        alive = [g.update(keys, shots) for g in games]
+        grid_state, brute_state = (game_state(g) for g in games)
+        if grid_state != brute_state:
+            return {"ticks": tick + 1, "enemies": enemies, "mismatch": tick + 1}
+        if not all(alive):
+            break
+    return {"ticks": tick + 1, "enemies": enemies, "mismatch": None}
+
+
+# startup
+def time_to_first_frame():
+    output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], capture_output=True, text=True, check=True,
+                            env=dict(os.environ, SDL_VIDEODRIVER="dummy")).stdout
+    return float(output.split()[-1])
+
+
+def clear_gradient_cache():
+    if os.path.isdir(game.CACHE_DIR):
+        for name in os.listdir(game.CACHE_DIR):
+            if name.startswith("gradient_"):
+                os.remove(os.path.join(game.CACHE_DIR, name))
+
+
+def bench_startup(runs=STARTUP_RUNS):
+    # cold runs have to build the gradient, warm runs load it from the disk cache
+    cold = []
+    for _ in range(runs):
+        clear_gradient_cache()
+        cold.append(time_to_first_frame())
+    warm = [time_to_first_frame() for _ in range(runs)]
+    return {"cold_ms": percentile(cold, 50), "warm_ms": percentile(warm, 50)}
+
+
+# stress scenarios
+def build_stress_game(count, seed=0, numpy_enemies=False, brute_force_collisions=False, flow_field=False,
+                      rect_collisions=False):
+    # count enemies of every type spread over the screen and as many projectiles in flight
+    g = game.Game(headless=True, seed=seed, numpy_enemies=numpy_enemies,
+                  brute_force_collisions=brute_force_collisions, flow_field=flow_field,
+                  rect_collisions=rect_collisions)
+    # the player must survive the whole run so every scenario times the same number of frames
+    g.player.health = count * STRESS_FRAMES + 1
+    for i in range(count):
+        g.spawn_enemy(g.enemy_kinds[i % len(g.enemy_kinds)])
+        x = g.rng.randint(0, game.SCREEN_WIDTH - game.IMAGE_SIZE)
+        y = g.rng.randint(0, game.SCREEN_HEIGHT - game.IMAGE_SIZE)
+        if g.swarm is not None:
+            g.swarm.pos[len(g.swarm) - 1] = (x, y)
+        else:
+            g.enemies[-1].rect.topleft = (x, y)
+    for _ in range(count):
+        add_stray_projectile(g, g.rng)
+    if g.grid:
+        g.grid.rebuild(g.enemies)
+    return g
+
+
+def add_stray_projectile(g, rng):
+    projectile = g.projectile_pool.acquire(game.Projectile, g.player)
+    projectile.rect.topleft = (rng.randint(10, game.SCREEN_WIDTH - 20), rng.randint(10, game.SCREEN_HEIGHT - 20))
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarise(values):
+    return {"mean": sum(values) / len(values), "p50": percentile(values, 50),
+            "p95": percentile(values, 95), "p99": percentile(values, 99), "max": max(values)}
+
+
+def bench_scenario(count, frames=STRESS_FRAMES, **options):
+    # the game's own frame profiler does the per-phase timing
+    g = build_stress_game(count, **options)
+    g.profiler = FrameProfiler(game.PROFILER_PHASES, 1000 / game.FPS, window=frames)
+    keys = game.KeyState()
+    for _ in range(frames):
+        g.profiler.begin_frame()
+        g.update(keys)
+        g.draw()
+        g.profiler.end_frame()
+    return {"count": count, "frames": frames, "frame_ms": summarise(g.profiler.frames),
+            "phases_ms": {phase: summarise(values) for phase, values in g.profiler.history.items()},
+            "draws": dict(g.profiler.counters)}
+
+
+def bench_stress(counts=STRESS_COUNTS, frames=STRESS_FRAMES, **options):
+    return [bench_scenario(count, frames, **options) for count in counts]
+
+
+# collisions with and without the mask narrow phase
+def collision_ms(count, frames, seed=0, **options):
+    # mean time of the collision phases, nothing is drawn
+    # between frames every enemy is healed and projectiles that hit or left are replaced, otherwise rect hits would
+    # use up projectiles the mask test lets fly on and each mode would time a different number of them
+    g = build_stress_game(count, seed, **options)
+    rng = random.Random(seed)
+    g.profiler = FrameProfiler(game.PROFILER_PHASES, 1000 / game.FPS, window=frames)
+    keys = game.KeyState()
+    for _ in range(frames):
+        heal_enemies(g)
+        for _ in range(count - len(g.projectiles)):
+            add_stray_projectile(g, rng)
+        g.profiler.begin_frame()
+        g.update(keys)
+        g.profiler.end_frame()
+    return summarise(g.profiler.history["collisions"])["mean"]
+
+
+def heal_enemies(g, health=1000):
+    if g.swarm is not None:
+        g.swarm.health[:len(g.swarm)] = health
+    for enemy in g.enemies:
+        enemy.health = health
+
+
+def bench_collisions(counts=COLLISION_COUNTS, frames=STRESS_FRAMES, repeats=COLLISION_REPEATS, **options):
+    results = []
+    for count in counts:
+        times = {True: [], False: []}
+        for _ in range(repeats):
+            for rect_collisions in times:
+                times[rect_collisions].append(collision_ms(count, frames, rect_collisions=rect_collisions, **options))
+        results.append({"count": count, "rect_ms": min(times[True]), "mask_ms": min(times[False])})
+    return results
+
+
+def compare(results, baseline):
+    # prints p95 changes against an older results file, returns True if anything got notably slower
+    old = {scenario["count"]: scenario for scenario in baseline["scenarios"]}
+    regressed = False
+    for scenario in results["scenarios"]:
+        before = old.get(scenario["count"])
+        if before is None:
+            continue
+        ratio = scenario["frame_ms"]["p95"] / before["frame_ms"]["p95"]
+        flag = ""
+        if ratio > REGRESSION_THRESHOLD:
+            regressed = True
+            flag = "  REGRESSION"
+        print(f"{scenario['count']:>6} entities: p95 {before['frame_ms']['p95']:.2f} -> "
+              f"{scenario['frame_ms']['p95']:.2f} ms ({ratio:.2f}x){flag}")
+    return regressed
+
+
+def print_results(results):
+    startup = results["startup"]
+    print(f"time to first frame: cold {startup['cold_ms']:.1f} ms, warm {startup['warm_ms']:.1f} ms")
+    background = results["background"]
+    print(f"background per frame: before {background['before_ms']:.3f} ms, after {background['after_ms']:.3f} ms")
+    for bubbles in results["bubbles"]:
+        print(f"{bubbles['count']:>6} bubbles per frame: before {bubbles['before_ms']:.3f} ms, "
+              f"after {bubbles['after_ms']:.3f} ms")
+    for wheel in results["scheduler"]:
+        print(f"{wheel['pending']:>8} pending events: schedule {wheel['schedule_us']:.2f} us, "
+              f"advance {wheel['tick_us']:.2f} us per tick ({wheel['fired_per_tick']:.1f} fired)")
+    for collisions in results["collisions"]:
+        ratio = collisions["mask_ms"] / collisions["rect_ms"]
+        print(f"{collisions['count']:>6} entities collisions per frame: rects {collisions['rect_ms']:.3f} ms, "
+              f"rects then masks {collisions['mask_ms']:.3f} ms ({ratio:.2f}x, "
+              + (f"within the {MASK_COST_TARGET}x target)" if ratio <= MASK_COST_TARGET
+                 else f"MISSES the {MASK_COST_TARGET}x target)"))
+    soak = results["soak"]
+    print(f"{soak['restarts']} restarts: stack depth {soak['stack_depth'][0]}-{soak['stack_depth'][1]}, "
+          f"traced memory {soak['memory_kb']:.0f} KB, grew {soak['growth_kb']:.1f} KB after warmup"
+          f"{'  LEAK' if soak['leaked'] else ''}")
+    check = results["grid_check"]
+    print(f"grid vs brute force collisions, {check['enemies']} enemies: "
+          + (f"identical for {check['ticks']} ticks" if check["mismatch"] is None
+             else f"DIFFER from tick {check['mismatch']}"))
+    for scenario in results["scenarios"]:
+        frame = scenario["frame_ms"]
+        phases = ", ".join(f"{phase} {values['mean']:.2f}" for phase, values in scenario["phases_ms"].items())
+        draws = scenario.get("draws", {})
+        print(f"{scenario['count']:>6} entities: p50 {frame['p50']:.2f} p95 {frame['p95']:.2f} "
+              f"p99 {frame['p99']:.2f} ms | {phases} | "
+              f"{draws.get('draw_calls', 0)} draw calls, {draws.get('blits', 0)} blits, "
+              f"{draws.get('culled', 0)} culled")
+
+
+# MAIN
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--counts", type=int, nargs="+", default=STRESS_COUNTS,
+                        help="enemies (and projectiles) per scenario")
+    parser.add_argument("--frames", type=int, default=STRESS_FRAMES, help="frames timed per scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--numpy-enemies", action="store_true")
+    parser.add_argument("--brute-force-collisions", action="store_true")
+    parser.add_argument("--flow-field", action="store_true")
+    parser.add_argument("--rect-collisions", action="store_true", help="stress scenarios without the mask tests")
+    parser.add_argument("--soak", type=int, default=SOAK_RESTARTS, help="restarts played by the soak check")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file from an earlier run to compare against")
+    args = parser.parse_args()
+
+    results = {
+        "python": platform.python_version(),
+        "pygame": py.version.ver,
+        "options": {"seed": args.seed, "numpy_enemies": args.numpy_enemies,
+                    "brute_force_collisions": args.brute_force_collisions, "flow_field": args.flow_field,
+                    "rect_collisions": args.rect_collisions},
+        "startup": bench_startup(),
+        "background": bench_background(),
+        "bubbles": bench_bubbles(),
+        "scheduler": bench_scheduler(),
+        "soak": soak_restarts(args.soak, numpy_enemies=args.numpy_enemies),
+        "grid_check": check_grid_collisions(seed=args.seed),
+        "collisions": bench_collisions(seed=args.seed, numpy_enemies=args.numpy_enemies,
+                                       brute_force_collisions=args.brute_force_collisions),
+        "scenarios": bench_stress(args.counts, args.frames, seed=args.seed, numpy_enemies=args.numpy_enemies,
+                                  brute_force_collisions=args.brute_force_collisions, flow_field=args.flow_field,
+                                  rect_collisions=args.rect_collisions),
+    }
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            if compare(results, json.load(file)):
+                sys.exit(1)
+    if results["soak"]["leaked"] or results["grid_check"]["mismatch"] is not None:
+        sys.exit(1)
+    py.quit()
@@ -0,0 +1,65 @@
+# IMPORTS
+import os
+import json
+import argparse
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame as py
+from new_main import SPRITE_SIZES, ATLAS_IMG, ATLAS_INDEX
+
+# CONSTANTS
+# transparent gap around every sprite so scaling or filtering never picks up a neighbour
+PADDING = 1
+MAX_ATLAS_WIDTH = 1024
+
+
+# SUBPROGRAMS
+def scale_sprite(path, size):
+    img = py.image.load(path)
+    if img.get_size() == size:
+        return img
+    return py.transform.smoothscale(img.convert_alpha(), size)
+
+
+def pack(sizes, max_width=MAX_ATLAS_WIDTH, padding=PADDING):
+    # shelf packing, tallest first, returns ({name: (x, y)}, atlas width, atlas height)
+    positions = {}
+    x = y = shelf_height = width = 0
+    for name, (w, h) in sorted(sizes.items(), key=lambda item: (-item[1][1], item[0])):
+        if x and x + w + padding > max_width:
+            x = 0
+            y += shelf_height + padding
+            shelf_height = 0
+        positions[name] = (x, y)
+        x += w + padding
+        width = max(width, x - padding)
+        shelf_height = max(shelf_height, h)
+    return positions, width, y + shelf_height
+
+
+def build_atlas(sprite_sizes=SPRITE_SIZES, image_path=ATLAS_IMG, index_path=ATLAS_INDEX):
+    # every sprite is scaled to its in-game size and copied into one image, the index maps names to rects
+    sprites = {name: scale_sprite(name, size) for name, size in sprite_sizes.items()}
+    positions, width, height = pack({name: img.get_size() for name, img in sprites.items()})
+    atlas = py.Surface((width, height), py.SRCALPHA)
+    rects = {}
+    for name, img in sprites.items():
+        rects[name] = [*positions[name], *img.get_size()]
+        atlas.blit(img, positions[name])
+    py.image.save(atlas, image_path)
+    with open(index_path, "w") as file:
+        json.dump({"image": os.path.basename(image_path), "sprites": rects}, file, indent=2, sort_keys=True)
+    return rects, (width, height)
+
+
+# MAIN
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="pack the game's sprites into one pre-scaled atlas")
+    parser.add_argument("--image", default=ATLAS_IMG)
+    parser.add_argument("--index", default=ATLAS_INDEX)
+    args = parser.parse_args()
+    py.init()
+    py.display.set_mode((1, 1))
+    rects, size = build_atlas(image_path=args.image, index_path=args.index)
+    print(f"packed {len(rects)} sprites into a {size[0]}x{size[1]} atlas")
+    py.quit()
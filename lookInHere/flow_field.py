@@ -0,0 +1,128 @@
+# IMPORTS
+import numpy as np
+
+# CONSTANTS
+# (dx, dy) to each neighbouring cell, straight moves first so they win ties with diagonals
+NEIGHBOURS = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+UNREACHED = -1
+BLOCKED = -2
+STRAIGHT = (0, 0)
+
+
+# CLASSES
+class FlowField:
+    # breadth-first distances out from the target's cell over a coarse grid, every cell then points at its closest
+    # neighbour, so steering is one lookup per enemy however many there are and routing round blocked cells is free
+    def __init__(self, width, height, cell_size, obstacles=()):
+        self.cell_size = cell_size
+        self.cols = -(-width // cell_size)
+        self.rows = -(-height // cell_size)
+        self.blocked = np.zeros((self.rows, self.cols), dtype=bool)
+        for rect in obstacles:
+            self.block(rect)
+        self.fill_template()
+        self.distance = np.full((self.rows, self.cols), UNREACHED, dtype=np.int32)
+        # unit (dx, dy) per cell, zero in the target's cell and in cells that can't reach it
+        self.direction = np.zeros((self.rows, self.cols, 2))
+        # the same as nested lists, indexing those is much cheaper than numpy for one sprite at a time
+        self.steer = self.direction.tolist()
+        self.target = None
+        self.builds = 0
+        length = np.hypot(*np.array(NEIGHBOURS, dtype=np.float64).T)
+        self.offsets = np.array(NEIGHBOURS, dtype=np.float64) / length[:, None]
+
+    def block(self, rect):
+        size = self.cell_size
+        self.blocked[max(0, rect.top // size):(rect.bottom - 1) // size + 1,
+                     max(0, rect.left // size):(rect.right - 1) // size + 1] = True
+        self.fill_template()
+        self.target = None
+
+    def fill_template(self):
+        # the starting distances fill_distance copies
+        template = np.pad(np.where(self.blocked, BLOCKED, UNREACHED), 1, constant_values=BLOCKED)
+        self.template = template.ravel().tolist()
+        # per neighbour, the cells a move that way can't make because it is diagonal and would clip the corner of a
+        # blocked cell, a sprite's centre then never crosses one on its way round
+        rows, cols = self.rows, self.cols
+        padded = np.pad(self.blocked, 1, constant_values=True)
+        self.corner_cut = np.stack([
+            (padded[1:1 + rows, 1 + dx:1 + dx + cols] | padded[1 + dy:1 + dy + rows, 1:1 + cols]) if dx and dy
+            else np.zeros((rows, cols), dtype=bool) for dx, dy in NEIGHBOURS])
+
+    def cell(self, x, y):
+        # targets off the grid use the nearest edge cell
+        return (min(max(int(y) // self.cell_size, 0), self.rows - 1),
+                min(max(int(x) // self.cell_size, 0), self.cols - 1))
+
+    def update(self, pos):
+        # only rebuilt when the target crosses into another cell, the obstacles never move
+        # returns True if it was rebuilt
+        target = self.cell(*pos)
+        if target == self.target:
+            return False
+        self.target = target
+        self.builds += 1
+        self.fill_distance(target)
+        self.fill_direction()
+        return True
+
+    def fill_distance(self, target):
+        # runs over a flat copy of the grid with a blocked ring round it, blocked cells start out with a distance
+        # that isn't UNREACHED so the search needs no bounds or obstacle checks
+        width = self.cols + 2
+        offsets = [(dx + dy * width, dx, dy * width) for dx, dy in NEIGHBOURS]
+        template = self.template
+        distance = template.copy()
+        start = (target[0] + 1) * width + target[1] + 1
+        distance[start] = 0
+        queue = [start]
+        # the list grows while it is looped over, that is the breadth-first queue
+        for i in queue:
+            step = distance[i] + 1
+            for offset, across, down in offsets:
+                j = i + offset
+                if distance[j] == UNREACHED:
+                    # diagonals only when both cells beside the corner are open
+                    if across and down and (template[i + across] == BLOCKED or template[i + down] == BLOCKED):
+                        continue
+                    distance[j] = step
+                    queue.append(j)
+        padded = np.array(distance, dtype=np.int32).reshape(self.rows + 2, width)
+        padded[padded == BLOCKED] = UNREACHED
+        self.distance[:] = padded[1:-1, 1:-1]
+
+    def fill_direction(self):
+        # blocked and unreached cells cost more than any real distance, so a sprite inside an obstacle is pointed
+        # out of it and one cut off from the target gets no direction
+        rows, cols = self.rows, self.cols
+        far = rows * cols
+        cost = np.where(self.distance == UNREACHED, far, self.distance)
+        padded = np.pad(cost, 1, constant_values=far)
+        around = np.stack([padded[1 + dy:1 + dy + rows, 1 + dx:1 + dx + cols] for dx, dy in NEIGHBOURS])
+        around[self.corner_cut] = far
+        best = around.argmin(axis=0)
+        closer = around.min(axis=0) < cost
+        np.multiply(self.offsets[best], closer[:, :, None], out=self.direction)
+        self.steer = self.direction.tolist()
+
+    def sample(self, x, y):
+        # (dx, dy) for the cell under integer (x, y), (0, 0) means steer straight at the target, as it does off
+        # the grid, where enemies are before they have come on screen
+        row = y // self.cell_size
+        col = x // self.cell_size
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return self.steer[row][col]
+        return STRAIGHT
+
+    def sample_many(self, positions):
+        # (n, 2) directions for an (n, 2) array of positions, zero off the grid like sample()
+        cells = (positions // self.cell_size).astype(np.intp)
+        on_grid = ((cells[:, 0] >= 0) & (cells[:, 0] < self.cols) & (cells[:, 1] >= 0) & (cells[:, 1] < self.rows))
+        directions = np.zeros_like(positions)
+        directions[on_grid] = self.direction[cells[on_grid, 1], cells[on_grid, 0]]
+        return directions
+
+    def stats(self):
+        return {"cells": self.rows * self.cols, "blocked": int(self.blocked.sum()), "builds": self.builds,
+                "reachable": int((self.distance != UNREACHED).sum())}
@@ -1,30 +1,71 @@
 # IMPORTS
+import time
+# taken before anything else is imported, for --profile-startup
+STARTED = time.perf_counter()
 import pygame as py
+import argparse
 import random
 import math
+import os
+import json
+import numpy as np
+from spatial_hash import SpatialHash
+from swarm import EnemySwarm
+from profiler import FrameProfiler, StartupTimeline
+from render_queue import RenderQueue
+from particles import ParticleSystem
+from quality import QualityGovernor
+from scheduler import TimerWheel
+from flow_field import FlowField
+from replay import InputRecorder, load_replay, replay_inputs, file_crc, NUMPY_ENEMIES, FLOW_FIELD, RECT_COLLISIONS
+IMPORTED = time.perf_counter()
 
 # CONSTANTS
 SCREEN_WIDTH = 600
 SCREEN_HEIGHT = 600
+# FPS is the fixed simulation tick rate, every "* FPS" timer below counts ticks
 FPS = 30
+# rendering runs as fast as this allows (0 for no cap), interpolating between ticks
+MAX_RENDER_FPS = 240
+# most ticks run in one rendered frame when catching up after a slow one
+MAX_TICKS_PER_FRAME = 5
 # assets
 PLAYER_IMG = "player.png"
 ENEMY_IMG = "enemy.png"
 PROJECTILE_IMG = "projectile.png"
 STRONGER_ENEMY_IMG = "stronger_enemy.png"
 STRONGEST_ENEMY_IMG = "strongest_enemy.png"
+ALL_IMGS = [PLAYER_IMG, ENEMY_IMG, PROJECTILE_IMG, STRONGER_ENEMY_IMG, STRONGEST_ENEMY_IMG]
 IMAGE_SIZE = 64
+PROJECTILE_SIZE = 8
+# in-game sizes, build_atlas.py scales every sprite to these and packs them into one image
+SPRITE_SIZES = {PLAYER_IMG: (IMAGE_SIZE, IMAGE_SIZE), ENEMY_IMG: (IMAGE_SIZE, IMAGE_SIZE),
+                STRONGER_ENEMY_IMG: (IMAGE_SIZE, IMAGE_SIZE), STRONGEST_ENEMY_IMG: (IMAGE_SIZE, IMAGE_SIZE),
+                PROJECTILE_IMG: (PROJECTILE_SIZE, PROJECTILE_SIZE)}
+ATLAS_IMG = "atlas.png"
+ATLAS_INDEX = "atlas.json"
 # OceanBackground colours
 TOP_COLOUR = (173, 216, 230)
 BOTTOM_COLOUR = (0, 0, 128)
 WAVE_COLOUR = (255, 255, 255, 90)
 BEAM_COLOUR = (255, 255, 224, 40)
-CORAL_COLOUR = (139, 69, 19)
+CORAL_COLOUR = (139, 69, 19, 100)
+# coral silhouettes on the sea floor, in screen coordinates, enemies steering by the flow field go round them
+CORAL_SHAPES = [[(100, 580), (120, 540), (140, 570)], [(440, 580), (460, 530), (480, 560)]]
 BUBBLE_COLOUR = (224, 255, 255)
-# difficulty
-STRONGER_ENEMY_SPAWN_TIME = 10
-ENEMY_SPAWN_TIME = 2
-STRONGEST_ENEMY_SPAWN_TIME = 30
+BUBBLE_COUNT = 15
+# frames cached for one period of the wave animation, more is smoother, each costs width * 22 * 4 bytes
+WAVE_FRAMES = 64
+WAVE_HEIGHT = 60
+# fonts
+FONT_NAME = "Arial"
+# a TTF shipped next to the game skips the system font lookup entirely
+FONT_FILE = "font.ttf"
+FONT_CACHE = "fonts.json"
+# generated files (gradients, font paths) are kept here between launches
+CACHE_DIR = ".cache"
+# difficulty, enemy waves are described in WAVES_FILE
+WAVES_FILE = "waves.json"
 AMMO_REGEN_TIME = 1
 INVULNERABILITY_TIME = 3
 PLAYER_V = 5
@@ -35,35 +76,253 @@ ENEMY_V = 3
 STRONGER_ENEMY_HEALTH = 5
 STRONG_ENEMY_V = 4
 STRONGEST_ENEMY_HEALTH = 10
+# flow field steering grid, half a sprite per cell
+FLOW_CELL_SIZE = IMAGE_SIZE // 2
+# rendering
+DIRTY_RECT_MAX_FRACTION = 0.5
+# draw order, the background is drawn before any of these
+LAYER_ENEMIES = 0
+LAYER_PROJECTILES = 1
+LAYER_PLAYER = 2
+LAYER_HUD = 3
+LAYERS = 4
+# quality levels the governor steps through when frames run over budget, (bubbles, wave interval, render scale)
+# the light beams are always baked into the static layer with the gradient so they cost nothing to shed
+QUALITY_LEVELS = [(BUBBLE_COUNT, 1, 1), (BUBBLE_COUNT // 3, 1, 1), (BUBBLE_COUNT // 3, 2, 1),
+                  (BUBBLE_COUNT // 3, 2, 0.5)]
+QUALITY_TARGET_FPS = 60
+# scenes, Game.run switches between these
+SCENE_START = "start"
+SCENE_PLAY = "play"
+SCENE_GAME_OVER = "game over"
+# profiler overlay
+PROFILER_KEY = py.K_F3
+PROFILER_PHASES = ["events", "projectiles", "collisions", "spawning", "enemies", "player", "hud", "background",
+                   "blits", "flip"]
+TEXT_COLOUR = (255, 255, 255)
+TEXT_CACHE_SIZE = 64
+# headless input scripts
+SCRIPT_KEYS = {"up": py.K_UP, "down": py.K_DOWN, "left": py.K_LEFT, "right": py.K_RIGHT}
+HEADLESS_FRAMES = 10000
 
 
 # CLASSES
 class Game:
-    def __init__(self):
-        # general setup
-        py.init()
-        self.screen = py.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        self.clock = py.time.Clock()
-        self.font = py.font.SysFont("Arial", 20)
+    def __init__(self, dirty_rects=False, brute_force_collisions=False, numpy_enemies=False, headless=False,
+                 seed=None, profile=False, record=None, wave_frames=WAVE_FRAMES, quality=None, defer_gameplay=False,
+                 timeline=None, waves=WAVES_FILE, flow_field=False, rect_collisions=False, simulate_only=False):
+        # general setup, only what the start screen needs
+        # defer_gameplay leaves sprites, background and the rest to load_gameplay, run when the game starts
+        # simulate_only is for stepping update() and nothing else, there is no window, font, background or
+        # renderer, so many games fit in one process
+        self.timeline = timeline
+        self.simulate_only = simulate_only
+        if headless or simulate_only:
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+        self.screen = None
+        self.clock = None
+        self.font = None
+        self.text = None
+        if not simulate_only:
+            # only the modules the game uses, py.init() would also start audio and joysticks
+            py.display.init()
+            py.font.init()
+            self.mark_startup("pygame init")
+            self.screen = py.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+            self.mark_startup("window")
+            self.clock = py.time.Clock()
+            self.font = load_font(20)
+            self.text = TextCache(self.font)
+            self.mark_startup("font")
         self.running = True
         self.high_score = 0
-        self.background = OceanBackground(SCREEN_WIDTH, SCREEN_HEIGHT)
+        # every random choice in the game comes from here so a seed reproduces a run
+        if record and seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        # only the first run is recorded, restarts carry on from a different random state
+        self.record_path = record
+        self.recorder = None
+        if record:
+            self.recorder = InputRecorder(seed, FPS, (NUMPY_ENEMIES if numpy_enemies else 0)
+                                          | (FLOW_FIELD if flow_field else 0)
+                                          | (RECT_COLLISIONS if rect_collisions else 0), file_crc(waves))
+        self.options = {"dirty_rects": dirty_rects, "brute_force_collisions": brute_force_collisions,
+                        "numpy_enemies": numpy_enemies, "wave_frames": wave_frames, "quality": quality,
+                        "waves": waves, "flow_field": flow_field, "rect_collisions": rect_collisions}
+        self.loaded = False
+        self.played = False
+        self.renderer = None
+        self.scene = None
+        self.inputs = None
+        self.scene_frames = {SCENE_START: self.menu_frame, SCENE_PLAY: self.play_frame,
+                             SCENE_GAME_OVER: self.menu_frame}
+        # None while the overlay is off, so the game loop only pays for an "is not None" check per phase
+        self.profiler = None
+        self.profiler_font = None
+        self.profiler_overlay = False
+        if profile:
+            self.toggle_profiler()
+        if not defer_gameplay:
+            self.load_gameplay()
+
+    def load_gameplay(self):
+        # everything only a running game needs, safe to call again
+        if self.loaded:
+            return
+        self.loaded = True
+        options = self.options
+        # one decode for every sprite when the atlas is built, the separate files otherwise
+        # simulation only needs the masks, the separate files are already the in-game sizes so they give the same ones
+        # without decoding the whole atlas
+        if self.simulate_only or not assets.load_atlas(ATLAS_INDEX):
+            assets.preload(ALL_IMGS)
+        self.mark_startup("sprites")
+        if not self.simulate_only:
+            self.load_rendering()
+        # brute force scans every enemy and is kept as the reference for the grid, see check_grid_collisions in
+        # benchmark.py
+        self.grid = None if options["brute_force_collisions"] else SpatialHash(IMAGE_SIZE)
+        # rects are always the broad phase, only pairs whose boxes overlap are tested pixel by pixel
+        # rect_collisions stops there, hits on the whole 64px boxes as before, kept as the reference
+        self.pixel_perfect = not options["rect_collisions"]
+        # per enemy type, where a projectile or the player touches its pixels, for the numpy enemies' pixel tests
+        self.projectile_hits = None
+        self.player_hits = None
+        # numpy enemy store for very large waves, enemies then never become sprites
+        self.enemy_kinds = [Enemy, StrongerEnemy, StrongestEnemy]
+        self.swarm = None
+        if options["numpy_enemies"]:
+            self.swarm = EnemySwarm([(assets.get(kind.img_name), kind.max_health, kind.speed)
+                                     for kind in self.enemy_kinds], IMAGE_SIZE,
+                                    masks=[assets.get_mask(kind.img_name) for kind in self.enemy_kinds])
+            if self.pixel_perfect:
+                self.projectile_hits = [assets.get_hit_table(kind.img_name, PROJECTILE_IMG)
+                                        for kind in self.enemy_kinds]
+                self.player_hits = [assets.get_hit_table(kind.img_name, PLAYER_IMG) for kind in self.enemy_kinds]
+        # one shared field steers every enemy round the coral instead of each heading straight for the player
+        self.flow_field = None
+        if options["flow_field"]:
+            self.flow_field = FlowField(SCREEN_WIDTH, SCREEN_HEIGHT, FLOW_CELL_SIZE, coral_rects())
+        # dead projectiles and enemies are recycled, self.projectiles and self.enemies are the pools' live lists
+        self.projectile_pool = EntityPool()
+        self.enemy_pool = EntityPool()
+        self.projectiles = self.projectile_pool.live
+        self.enemies = self.enemy_pool.live
+        # names used in the waves file
+        self.enemy_names = {"enemy": Enemy, "stronger": StrongerEnemy, "strongest": StrongestEnemy}
+        self.waves = load_waves(options["waves"])
+        self.scheduler = TimerWheel()
+        self.reset()
+        self.mark_startup("gameplay ready")
+
+    def load_rendering(self):
+        options = self.options
+        # the coral is only there when it is an obstacle, straight-seeking enemies would swim through it
+        self.background = OceanBackground(SCREEN_WIDTH, SCREEN_HEIGHT, random.Random(self.seed),
+                                          wave_frames=options["wave_frames"], coral=options["flow_field"])
+        self.mark_startup("background")
+        self.render_queue = RenderQueue(SCREEN_WIDTH, SCREEN_HEIGHT, LAYERS)
+        self.renderer = DirtyRectRenderer(self.screen, self.background) if options["dirty_rects"] else None
+        # quality None lets the governor pick the level from frame times, a number pins it
+        self.wave_frames = options["wave_frames"]
+        self.governor = None
+        if options["quality"] is None:
+            self.governor = QualityGovernor(1000 / QUALITY_TARGET_FPS, len(QUALITY_LEVELS))
+        self.quality = 0
+        # what frames are drawn to, smaller than the screen at reduced render scales, with its own background
+        self.canvas = self.screen
+        self.canvas_background = self.background
+        self.low_res_backgrounds = {}
+        self.set_quality(options["quality"] or 0)
+
+    def mark_startup(self, label):
+        if self.timeline is not None:
+            self.timeline.mark(label)
+
+    def finish_startup(self, label):
+        # prints the timeline once, at the first gameplay frame
+        if self.timeline is not None:
+            self.timeline.mark(label)
+            print(self.timeline.report())
+            self.timeline = None
+
+    def reset(self):
         # repeatable setup
         self.player = Player()
-        self.sprites = []
-        self.enemies = []
-        self.projectiles = []
-        self.sprites.append(self.player)
+        self.projectile_pool.clear()
+        self.enemy_pool.clear()
+        # everything that moves, for snapshot_positions
+        self.sprite_layers = [[self.player], self.enemies, self.projectiles]
         self.count = 1
         self.score = 0
+        if self.grid:
+            self.grid.clear()
+        if self.swarm is not None:
+            self.swarm.clear()
+        self.schedule_waves()
+
+    def schedule_waves(self):
+        # events are tuples starting with their type, repeats reschedule themselves when they fire
+        scheduler = self.scheduler
+        scheduler.clear()
+        self.difficulty = 1.0
+        scheduler.schedule(AMMO_REGEN_TIME * FPS, ("ammo",))
+        for repeat in self.waves["repeat"]:
+            scheduler.schedule(seconds_to_ticks(repeat.get("start", repeat["every"])), ("repeat", repeat))
+        for spawn in self.waves["spawns"]:
+            y = spawn[2] if len(spawn) > 2 else None
+            scheduler.schedule(seconds_to_ticks(spawn[0]), ("spawn", self.enemy_names[spawn[1]], y))
+        for seconds, multiplier in self.waves["difficulty"]:
+            scheduler.schedule(seconds_to_ticks(seconds), ("difficulty", multiplier))
+
+    def run(self, scene=SCENE_START, inputs=None):
+        # the only loop in the game, scenes hand over by returning the next scene instead of calling each other,
+        # so the stack stays the same depth however many times the game is restarted
+        # inputs replays recorded (keys, shots) ticks instead of reading the keyboard
+        self.inputs = inputs
+        self.enter_scene(scene)
+        while self.running:
+            self.run_frame()
+            self.clock.tick(MAX_RENDER_FPS)
+        py.quit()
+
+    def run_frame(self):
+        next_scene = self.scene_frames[self.scene]()
+        if next_scene != self.scene:
+            self.enter_scene(next_scene)
+
+    def enter_scene(self, scene):
+        self.scene = scene
+        if scene == SCENE_START:
+            self.start_screen()
+        elif scene == SCENE_PLAY:
+            self.start_play()
+        elif scene == SCENE_GAME_OVER:
+            self.end_screen()
+
+    def menu_frame(self):
+        # start and game over wait for enter
+        for event in py.event.get():
+            if event.type == py.QUIT:
+                self.running = False
+            if event.type == py.KEYDOWN:
+                if event.key == py.K_ESCAPE:
+                    self.running = False
+                if event.key == py.K_RETURN:
+                    if self.scene == SCENE_START:
+                        self.mark_startup("enter pressed")
+                    return SCENE_PLAY
+        return self.scene
 
     def start_screen(self):
         # create text
-        text1 = self.font.render("press enter to start", True, (255, 255, 255))
+        text1 = self.text.render("press enter to start")
         text1_rect = text1.get_rect()
         text1_rect.center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
 
-        text2 = self.font.render("arrows to move, space to shoot", True, (255, 255, 255))
+        text2 = self.text.render("arrows to move, space to shoot")
         text2_rect = text2.get_rect()
         text2_rect.center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 - 20)
 
@@ -72,18 +331,7 @@ class Game:
         self.screen.blit(text1, text1_rect)
         self.screen.blit(text2, text2_rect)
         py.display.flip()
-
-        # loop for quiting game
-        while self.running:
-            for event in py.event.get():
-                if event.type == py.QUIT:
-                    self.running = False
-                if event.type == py.KEYDOWN:
-                    if event.key == py.K_ESCAPE:
-                        self.running = False
-                    if event.key == py.K_RETURN:
-                        self.main_screen()
-        py.quit()
+        self.mark_startup("start screen")
 
     def end_screen(self):
         # scoring
@@ -91,19 +339,19 @@ class Game:
             self.high_score = self.score
 
         # creating text
-        text1 = self.font.render("GAME OVER", True, (255, 255, 255))
+        text1 = self.text.render("GAME OVER")
         text1_rect = text1.get_rect()
         text1_rect.center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 - 40)
 
-        text2 = self.font.render("press enter to restart", True, (255, 255, 255))
+        text2 = self.text.render("press enter to restart")
         text2_rect = text2.get_rect()
         text2_rect.center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 - 20)
 
-        text3 = self.font.render(f"score: {self.score}", True, (255, 255, 255))
+        text3 = self.text.render(f"score: {self.score}")
         text3_rect = text3.get_rect()
         text3_rect.center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
 
-        text4 = self.font.render(f"high score: {self.high_score}", True, (255, 255, 255))
+        text4 = self.text.render(f"high score: {self.high_score}")
         text4_rect = text4.get_rect()
         text4_rect.center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + 20)
 
@@ -117,137 +365,332 @@ class Game:
 
         py.display.flip()
 
-        # loop for either replaying or quiting game
-        while self.running:
-            for event in py.event.get():
-                if event.type == py.QUIT:
+    def start_play(self):
+        # every run after the first starts from a reset, pools are emptied in place rather than rebuilt
+        self.load_gameplay()
+        if self.played:
+            self.reset()
+        self.played = True
+        # the start and end screens painted over everything
+        if self.renderer:
+            self.renderer.invalidate()
+        # fixed timestep, the game ticks FPS times a second however fast frames are drawn
+        self.lag = 0.0
+        self.previous = time.perf_counter()
+        self.shots = 0
+
+    def play_frame(self):
+        tick = 1 / FPS
+        inputs = self.inputs
+        now = time.perf_counter()
+        # a very slow frame only catches up MAX_TICKS_PER_FRAME ticks, the rest is dropped
+        self.lag = min(self.lag + now - self.previous, MAX_TICKS_PER_FRAME * tick)
+        self.previous = now
+        if self.profiler is not None:
+            self.profiler.begin_frame()
+        for event in py.event.get():
+            if event.type == py.QUIT:
+                self.running = False
+            if event.type == py.KEYDOWN:
+                if event.key == py.K_ESCAPE:
                     self.running = False
-                if event.type == py.KEYDOWN:
-                    if event.key == py.K_ESCAPE:
-                        self.running = False
-                    if event.key == py.K_RETURN:
-                        for sprite in self.sprites:
-                            del sprite
-                        # repeatable setup
-                        self.player = Player()
-                        self.sprites = []
-                        self.enemies = []
-                        self.projectiles = []
-                        self.sprites.append(self.player)
-                        self.count = 1
-                        self.score = 0
-                        # replay
-                        self.main_screen()
-        py.quit()
-
-    def main_screen(self):
-        # game loop
-        while self.running:
-            for event in py.event.get():
-                if event.type == py.QUIT:
+                if event.key == py.K_SPACE and inputs is None:
+                    self.shots += 1
+                if event.key == PROFILER_KEY:
+                    self.toggle_profiler()
+
+        keys = py.key.get_pressed()
+        if self.profiler is not None:
+            self.profiler.mark("events")
+
+        died = False
+        while self.lag >= tick:
+            if inputs is not None:
+                step = next(inputs, None)
+                if step is None:
                     self.running = False
-                if event.type == py.KEYDOWN:
-                    if event.key == py.K_ESCAPE:
-                        self.running = False
-                    if event.key == py.K_SPACE:
-                        if self.player.get_ammo() > 0:
-                            projectile = Projectile(self.player)
-                            self.projectiles.append(projectile)
-                            self.sprites.append(projectile)
-                            self.player.minus_ammo()
-
-            keys = py.key.get_pressed()
-
-            # creating text
-            text1 = self.font.render(f"health: {self.player.get_health()}", True, (255, 255, 255))
-            text1_rect = text1.get_rect()
-            text1_rect.center = (SCREEN_WIDTH // 2, 20)
-
-            text2 = self.font.render(f"score: {self.score}", True, (255, 255, 255))
-            text2_rect = text2.get_rect()
-            text2_rect.center = (SCREEN_WIDTH // 2, 40)
-
-            text3 = self.font.render(f"ammo: {self.player.get_ammo()}", True, (255, 255, 255))
-            text3_rect = text3.get_rect()
-            text3_rect.center = (SCREEN_WIDTH // 2, 60)
-
-            # updating projectiles
-            for i in range(len(self.projectiles) - 1, 0, -1):
-                self.projectiles[i].move()
-                # deleting extra projectile objects
-                if self.projectiles[i].wall_collide():
-                    self.sprites.remove(self.projectiles[i])
-                    del self.projectiles[i]
-                elif self.projectiles[i].enemy_collide(self.enemies):
-                    self.sprites.remove(self.projectiles[i])
-                    del self.projectiles[i]
-
-            # spawning enemies
-            if self.count % (STRONGEST_ENEMY_SPAWN_TIME * FPS) == 0:
-                enemy1 = StrongestEnemy()
-                enemy2 = StrongerEnemy()
-                enemy3 = StrongerEnemy()
-                self.enemies.append(enemy1)
-                self.sprites.append(enemy1)
-                self.enemies.append(enemy2)
-                self.sprites.append(enemy2)
-                self.enemies.append(enemy3)
-                self.sprites.append(enemy3)
-            elif self.count % (STRONGER_ENEMY_SPAWN_TIME * FPS) == 0:
-                enemy = StrongerEnemy()
-                self.enemies.append(enemy)
-                self.sprites.append(enemy)
-            elif self.count % (ENEMY_SPAWN_TIME * FPS) == 0:
-                enemy = Enemy()
-                self.enemies.append(enemy)
-                self.sprites.append(enemy)
-
-            # updating enemies
-            for i in range(len(self.enemies) - 1, 0, -1):
-                self.enemies[i].move_towards_player(self.player.get_pos())
-                # deleting dead enemy objects
-                if self.enemies[i].get_health() <= 0:
-                    self.sprites.remove(self.enemies[i])
-                    del self.enemies[i]
-
-            # updating player
-            self.player.move(keys)
-            self.player.wall_collide()
-            self.player.is_invulnerable()
-            self.player.enemy_collide(self.enemies)
-            if self.player.get_health() <= 0:
-                self.end_screen()
+                    break
+                keys, self.shots = step
+            if self.recorder is not None:
+                self.recorder.record(keys, self.shots, not self.running)
+            self.snapshot_positions()
+            # shots wait for the next tick if this frame has none
+            if not self.update(keys, self.shots):
+                died = True
                 break
-            if self.count % (AMMO_REGEN_TIME * FPS) == 0:
+            # the background animates per tick too, so its speed doesn't depend on the frame rate
+            self.canvas_background.tick()
+            self.shots = 0
+            self.lag -= tick
+        if died or not self.running:
+            self.finish_recording()
+        if died:
+            if inputs is not None:
+                # a replay ends when the recorded run did
+                self.running = False
+                return SCENE_PLAY
+            return SCENE_GAME_OVER
+        self.draw(self.lag / tick)
+        self.finish_startup("first frame")
+        if self.profiler is not None:
+            self.profiler.end_frame()
+        if self.governor is not None and self.governor.update((time.perf_counter() - now) * 1000):
+            self.set_quality(self.governor.level)
+        return SCENE_PLAY
+
+    def finish_recording(self):
+        if self.recorder is not None:
+            self.recorder.save(self.record_path)
+            self.recorder = None
+
+    def update(self, keys, shots=0):
+        # one frame of game logic with no drawing, returns False once the player has died
+        profiler = self.profiler
+        for _ in range(shots):
+            self.shoot()
+        self.update_projectiles()
+        if profiler is not None:
+            profiler.mark("projectiles")
+        self.collide_projectiles()
+        if profiler is not None:
+            profiler.mark("collisions")
+        self.fire_events()
+        if profiler is not None:
+            profiler.mark("spawning")
+        self.update_enemies()
+        if profiler is not None:
+            profiler.mark("enemies")
+        self.update_player(keys)
+        if profiler is not None:
+            profiler.mark("player")
+        self.collide_player()
+        if profiler is not None:
+            profiler.mark("collisions")
+        if self.player.get_health() <= 0:
+            return False
+
+        self.count += 1
+        if self.count % FPS == 0:
+            self.score += 1
+        return True
+
+    def update_projectiles(self):
+        # releasing swaps the last projectile into slot i, which this reverse loop has already visited
+        for i in range(len(self.projectiles) - 1, -1, -1):
+            projectile = self.projectiles[i]
+            projectile.move()
+            # recycling projectiles that left the screen
+            if projectile.wall_collide():
+                self.projectile_pool.release(projectile)
+
+    def collide_projectiles(self):
+        if self.swarm is not None:
+            hits = self.swarm.projectile_hits([projectile.rect for projectile in self.projectiles],
+                                              self.projectile_hits)
+            for i in range(len(self.projectiles) - 1, -1, -1):
+                if hits[i]:
+                    self.projectile_pool.release(self.projectiles[i])
+            return
+        for i in range(len(self.projectiles) - 1, -1, -1):
+            projectile = self.projectiles[i]
+            if projectile.enemy_collide(self.enemies, self.grid, self.pixel_perfect):
+                self.projectile_pool.release(projectile)
+
+    def fire_events(self):
+        # spawns, ammo regen and difficulty changes due this tick
+        tick = self.count
+        for event in self.scheduler.advance(tick):
+            kind = event[0]
+            if kind == "spawn":
+                self.spawn_enemy(event[1], event[2])
+            elif kind == "repeat":
+                repeat = event[1]
+                if not any(tick % seconds_to_ticks(every) == 0 for every in repeat.get("except_every", ())):
+                    for name in repeat["spawn"]:
+                        self.spawn_enemy(self.enemy_names[name])
+                interval = max(1, round(seconds_to_ticks(repeat["every"]) / self.difficulty))
+                self.scheduler.schedule(tick + interval, event)
+            elif kind == "ammo":
                 self.player.add_ammo()
+                self.scheduler.schedule(tick + AMMO_REGEN_TIME * FPS, event)
+            elif kind == "difficulty":
+                self.difficulty = event[1]
+
+    def update_enemies(self):
+        player_pos = self.player.get_pos()
+        field = self.flow_field
+        if field is not None:
+            field.update(player_pos)
+        if self.swarm is not None:
+            self.swarm.step(player_pos, field)
+        for i in range(len(self.enemies) - 1, -1, -1):
+            enemy = self.enemies[i]
+            enemy.move_towards_player(player_pos, field)
+            # recycling dead enemies
+            if enemy.get_health() <= 0:
+                self.enemy_pool.release(enemy)
+        # enemies only move or die here, so this grid also serves the next frame's projectiles
+        if self.grid:
+            self.grid.rebuild(self.enemies)
+
+    def update_player(self, keys):
+        self.player.move(keys)
+        self.player.wall_collide()
+        self.player.is_invulnerable()
+
+    def collide_player(self):
+        if self.swarm is not None:
+            if not self.player.invulnerable and self.swarm.collides(self.player.rect, self.player_hits):
+                self.player.hit()
+            return
+        self.player.enemy_collide(self.enemies, self.grid, self.pixel_perfect)
+
+    def snapshot_positions(self):
+        # where every sprite was before the tick, draw() interpolates from here
+        for layer in self.sprite_layers:
+            for sprite in layer:
+                sprite.prev_x = sprite.rect.x
+                sprite.prev_y = sprite.rect.y
+
+    def draw(self, alpha=1.0):
+        # alpha is how far between the last two ticks this frame is
+        profiler = self.profiler
+        hud = self.render_hud()
+        if profiler is not None:
+            profiler.mark("hud")
+        self.queue_sprites(hud, alpha)
+        if profiler is not None:
+            profiler.count("quality", self.quality)
+        canvas = self.canvas
+        if self.renderer and canvas is self.screen:
+            self.renderer.draw(self.render_queue, profiler, self.draw_profiler if self.profiler_overlay else None)
+            return
+        self.canvas_background.draw(canvas)
+        if profiler is not None:
+            profiler.mark("background")
+        self.render_queue.flush(canvas)
+        if canvas is not self.screen:
+            py.transform.scale(canvas, self.screen.get_size(), self.screen)
+        if profiler is not None:
+            self.render_queue.report(profiler)
+            profiler.mark("blits")
+        if self.profiler_overlay:
+            self.draw_profiler(self.screen)
+        py.display.flip()
+        if profiler is not None:
+            profiler.mark("flip")
+
+    def set_quality(self, level):
+        self.quality = level
+        bubbles, wave_interval, scale = QUALITY_LEVELS[level]
+        self.render_queue.set_scale(scale)
+        if scale == 1:
+            self.canvas = self.screen
+            self.canvas_background = self.background
+        else:
+            if scale not in self.low_res_backgrounds:
+                size = (int(SCREEN_WIDTH * scale), int(SCREEN_HEIGHT * scale))
+                self.low_res_backgrounds[scale] = (py.Surface(size), OceanBackground(
+                    *size, random.Random(self.seed), wave_frames=self.wave_frames, scale=scale,
+                    coral=self.options["flow_field"]))
+            self.canvas, self.canvas_background = self.low_res_backgrounds[scale]
+        self.canvas_background.set_quality(bubbles, wave_interval)
+        if self.renderer:
+            self.renderer.invalidate()
+
+    def toggle_profiler(self):
+        if self.profiler_overlay:
+            self.profiler = None
+            self.profiler_overlay = False
+            if self.renderer:
+                # the overlay's last position has to be painted over
+                self.renderer.invalidate()
+            return
+        if self.profiler_font is None:
+            self.profiler_font = load_font(12)
+        self.profiler = FrameProfiler(PROFILER_PHASES, 1000 / FPS)
+        self.profiler.begin_frame()
+        self.profiler_overlay = True
+
+    def draw_profiler(self, screen):
+        # the overlay's own cost stays out of the phase timings
+        rect = self.profiler.draw(screen, self.profiler_font)
+        self.profiler.skip()
+        return rect
+
+    def render_hud(self):
+        # creating text
+        text1 = self.text.render(f"health: {self.player.get_health()}")
+        text1_rect = text1.get_rect()
+        text1_rect.center = (SCREEN_WIDTH // 2, 20)
 
-            # drawing ocean background
-            self.background.draw(self.screen)
+        text2 = self.text.render(f"score: {self.score}")
+        text2_rect = text2.get_rect()
+        text2_rect.center = (SCREEN_WIDTH // 2, 40)
 
-            # drawing text
-            self.screen.blit(text1, text1_rect)
-            self.screen.blit(text2, text2_rect)
-            self.screen.blit(text3, text3_rect)
+        text3 = self.text.render(f"ammo: {self.player.get_ammo()}")
+        text3_rect = text3.get_rect()
+        text3_rect.center = (SCREEN_WIDTH // 2, 60)
+        return [(text1, text1_rect), (text2, text2_rect), (text3, text3_rect)]
+
+    def queue_sprites(self, hud, alpha=1.0):
+        queue = self.render_queue
+        queue.clear()
+        for enemy in self.enemies:
+            queue.add(LAYER_ENEMIES, enemy.img, lerp_pos(enemy, alpha))
+        if self.swarm is not None:
+            groups, culled = self.swarm.blit_groups(SCREEN_WIDTH, SCREEN_HEIGHT, alpha)
+            for img, positions in groups:
+                queue.add_group(LAYER_ENEMIES, img, positions)
+            queue.culled += culled
+        for projectile in self.projectiles:
+            queue.add(LAYER_PROJECTILES, projectile.img, lerp_pos(projectile, alpha))
+        queue.add(LAYER_PLAYER, self.player.img, lerp_pos(self.player, alpha))
+        for text, text_rect in hud:
+            queue.add(LAYER_HUD, text, text_rect)
+
+    def run_headless(self, inputs, max_frames=None):
+        # steps the game as fast as possible from (keys, shots) pairs without drawing anything
+        self.load_gameplay()
+        self.finish_startup("headless run")
+        frames = 0
+        start = time.perf_counter()
+        for keys, shots in inputs:
+            if max_frames is not None and frames >= max_frames:
+                break
+            frames += 1
+            if self.recorder is not None:
+                self.recorder.record(keys, shots)
+            if not self.update(keys, shots):
+                break
+        seconds = time.perf_counter() - start
+        self.finish_recording()
+        return {"frames": frames, "seconds": seconds, "fps": frames / seconds if seconds else 0.0,
+                "score": self.score, "health": self.player.get_health(), "seed": self.seed}
 
-            # displaying sprites
-            for sprite in self.sprites:
-                self.screen.blit(sprite.img, sprite.rect)
+    def shoot(self):
+        if self.player.get_ammo() > 0:
+            self.projectile_pool.acquire(Projectile, self.player)
+            self.player.minus_ammo()
 
-            # updating display and game
-            py.display.flip()
-            self.clock.tick(FPS)
-            self.count += 1
-            if self.count % FPS == 0:
-                self.score += 1
-        py.quit()
+    def spawn_enemy(self, enemy_class, y=None):
+        # y is random unless the waves file gave one
+        if self.swarm is not None:
+            self.swarm.spawn(self.enemy_kinds.index(enemy_class), SCREEN_WIDTH,
+                             self.rng.randint(0, SCREEN_HEIGHT - 50) if y is None else y)
+        else:
+            self.enemy_pool.acquire(enemy_class, self.rng, y)
 
 
 class Player(py.sprite.Sprite):
     def __init__(self):
         super().__init__()
-        self.img = py.image.load(PLAYER_IMG).convert_alpha()
+        self.img = assets.get(PLAYER_IMG)
+        self.mask = assets.get_mask(PLAYER_IMG)
         self.rect = py.Rect(SCREEN_WIDTH // 2 - IMAGE_SIZE // 2, SCREEN_HEIGHT // 2 - IMAGE_SIZE // 2, IMAGE_SIZE,
                             IMAGE_SIZE)
+        self.prev_x = self.rect.x
+        self.prev_y = self.rect.y
         self.v = PLAYER_V
         self.health = PLAYER_HEALTH
         self.invulnerable = False
@@ -274,13 +717,28 @@ class Player(py.sprite.Sprite):
         if self.rect.bottom >= SCREEN_HEIGHT:
             self.rect.bottom = SCREEN_HEIGHT
 
-    def enemy_collide(self, enemies):
-        count = 0
-        while (not self.invulnerable) and (count < len(enemies)):
-            if self.rect.colliderect(enemies[count]):
-                self.health -= 1
-                self.invulnerable = True
-            count += 1
+    def enemy_collide(self, enemies, grid=None, pixel_perfect=True):
+        # grid narrows the scan down to the enemies sharing a cell with the player
+        # rects are the broad phase, the pixel test only runs for enemies whose box overlaps the player's
+        rect = self.rect
+        x, y = rect.x, rect.y
+        candidates = grid.query(rect) if grid else range(len(enemies))
+        for i in candidates:
+            if self.invulnerable:
+                break
+            enemy = enemies[i]
+            other = enemy.rect
+            if not rect.colliderect(other):
+                continue
+            if pixel_perfect:
+                table, width, origin = enemy.player_hits
+                if not table[origin + (y - other.y) * width + x - other.x]:
+                    continue
+            self.hit()
+
+    def hit(self):
+        self.health -= 1
+        self.invulnerable = True
 
     def get_health(self):
         return self.health
@@ -307,9 +765,16 @@ class Player(py.sprite.Sprite):
 class Projectile(py.sprite.Sprite):
     def __init__(self, player):
         super().__init__()
-        self.img = py.image.load(PROJECTILE_IMG).convert_alpha()
-        self.rect = py.Rect(player.rect.right, player.rect.centery - 4, 8, 8)
+        self.img = assets.get(PROJECTILE_IMG)
+        self.mask = assets.get_mask(PROJECTILE_IMG)
+        self.rect = py.Rect(0, 0, PROJECTILE_SIZE, PROJECTILE_SIZE)
         self.v = 7
+        self.reset(player)
+
+    def reset(self, player):
+        # also called by EntityPool when a recycled projectile is fired again
+        self.rect.x = self.prev_x = player.rect.right
+        self.rect.y = self.prev_y = player.rect.centery - 4
 
     def move(self):
         self.rect.move_ip(self.v, 0)
@@ -329,24 +794,54 @@ class Projectile(py.sprite.Sprite):
             return 1
         return 0
 
-    def enemy_collide(self, enemies):
-        for enemy in enemies:
-            if self.rect.colliderect(enemy):
-                enemy.set_health(enemy.get_health() - 1)
-                del self
-                return 1
+    def enemy_collide(self, enemies, grid=None, pixel_perfect=True):
+        rect = self.rect
+        x, y = rect.x, rect.y
+        candidates = grid.query(rect) if grid else range(len(enemies))
+        for i in candidates:
+            enemy = enemies[i]
+            other = enemy.rect
+            if not rect.colliderect(other):
+                continue
+            if pixel_perfect:
+                table, width, origin = enemy.projectile_hits
+                if not table[origin + (y - other.y) * width + x - other.x]:
+                    continue
+            enemy.set_health(enemy.get_health() - 1)
+            del self
+            return 1
         return 0
 
 
 class Enemy(py.sprite.Sprite):
-    def __init__(self):
-        super().__init__()
-        self.img = py.image.load(ENEMY_IMG).convert_alpha()
-        self.rect = py.Rect(SCREEN_WIDTH, random.randint(0, SCREEN_HEIGHT - 50), IMAGE_SIZE, IMAGE_SIZE)
-        self.v = ENEMY_V
-        self.health = ENEMY_HEALTH
+    img_name = ENEMY_IMG
+    max_health = ENEMY_HEALTH
+    speed = ENEMY_V
 
-    def move_towards_player(self, player_pos):
+    def __init__(self, rng=random, y=None):
+        super().__init__()
+        self.img = assets.get(self.img_name)
+        self.mask = assets.get_mask(self.img_name)
+        # pixel tests against projectiles and the player, shared by every enemy of this type
+        self.projectile_hits = assets.get_hit_table(self.img_name, PROJECTILE_IMG)
+        self.player_hits = assets.get_hit_table(self.img_name, PLAYER_IMG)
+        self.rect = py.Rect(0, 0, IMAGE_SIZE, IMAGE_SIZE)
+        self.reset(rng, y)
+
+    def reset(self, rng=random, y=None):
+        # also called by EntityPool when a recycled enemy respawns
+        self.rect.x = self.prev_x = SCREEN_WIDTH
+        self.rect.y = self.prev_y = rng.randint(0, SCREEN_HEIGHT - 50) if y is None else y
+        self.v = self.speed
+        self.health = self.max_health
+
+    def move_towards_player(self, player_pos, field=None):
+        # with a flow field the enemy follows its cell's direction, straight at the player in the player's cell
+        if field is not None:
+            dx, dy = field.sample(self.rect.centerx, self.rect.centery)
+            if dx or dy:
+                self.rect.move_ip(dx * self.v, dy * self.v)
+                return
         dx = player_pos[0] - self.rect.centerx
         dy = player_pos[1] - self.rect.centery
         distance = math.hypot(dx, dy)
@@ -363,75 +858,101 @@ class Enemy(py.sprite.Sprite):
 
 
 class StrongerEnemy(Enemy):
-    def __init__(self):
-        super().__init__()
-        self.health = STRONGER_ENEMY_HEALTH
-        self.v = STRONG_ENEMY_V
-        self.img = py.image.load(STRONGER_ENEMY_IMG).convert_alpha()
+    img_name = STRONGER_ENEMY_IMG
+    max_health = STRONGER_ENEMY_HEALTH
+    speed = STRONG_ENEMY_V
 
 
 class StrongestEnemy(StrongerEnemy):
-    def __init__(self):
-        super().__init__()
-        self.health = STRONGEST_ENEMY_HEALTH
-        self.img = py.image.load(STRONGEST_ENEMY_IMG).convert_alpha()
+    img_name = STRONGEST_ENEMY_IMG
+    max_health = STRONGEST_ENEMY_HEALTH
 
 
 class OceanBackground:
-    def __init__(self, width, height):
+    def __init__(self, width, height, rng=random, bubbles=BUBBLE_COUNT, wave_frames=WAVE_FRAMES, scale=1,
+                 coral=False):
+        # scale shrinks every size and distance, for drawing to a lower resolution canvas of width x height
+        if wave_frames < 1:
+            raise ValueError(f"wave_frames must be at least 1, got {wave_frames}")
         self.width = width
         self.height = height
+        self.scale = scale
         self.gradient_surface = create_gradient_surface(width, height, TOP_COLOUR, BOTTOM_COLOUR)
         self.wave_phase = 0
         self.wave_speed = 0.05
-        self.wave_amplitude = 10
-        self.wave_frequency = 0.02
-        self.bubbles = self.create_bubbles(15)
-
-    def create_bubbles(self, count):
-        bubbles = []
-        for _ in range(count):
-            bubble = {
-                'x': random.randint(50, self.width - 50),
-                'y': random.randint(self.height - 100, self.height - 10),
-                'radius': random.randint(3, 8),
-                'speed': random.uniform(0.5, 1.5)
-            }
-            bubbles.append(bubble)
-        return bubbles
-
-    def update_bubbles(self):
-        for bubble in self.bubbles:
-            bubble['y'] -= bubble['speed']
-            if bubble['y'] + bubble['radius'] < 0:
-                bubble['x'] = random.randint(50, self.width - 50)
-                bubble['y'] = self.height + random.randint(5, 50)
-                bubble['radius'] = random.randint(3, 8)
-                bubble['speed'] = random.uniform(0.5, 1.5)
+        self.wave_level = 50 * scale
+        self.wave_amplitude = 10 * scale
+        self.wave_frequency = 0.02 / scale
+        self.wave_height = int(WAVE_HEIGHT * scale)
+        # shown every frame, higher only moves the waves on every wave_interval ticks
+        self.wave_interval = 1
+        self.wave_tick = 0
+        # the particle system has its own numpy generator, seeded from rng so a seeded game still reproduces
+        self.bubbles = ParticleSystem(bubbles, width, height, BUBBLE_COLOUR,
+                                      radii=(max(1, round(3 * scale)), max(1, round(8 * scale))),
+                                      speeds=(0.5 * scale, 1.5 * scale), margin=int(50 * scale),
+                                      seed=rng.getrandbits(64))
+        # gradient and beams never change, so they are composited once here
+        self.static_layer = self.gradient_surface.copy()
+        self.draw_light_beams(self.static_layer)
+        if coral:
+            self.draw_coral(self.static_layer)
+        # wave_phase advances by a constant step so the waves loop, each frame of one period is rendered the first
+        # time it is shown and blitted from then on, cropped to the rows the line can reach
+        self.wave_frames = [None] * wave_frames
+        self.wave_top = int(self.wave_level - self.wave_amplitude) - 2
+
+    def set_quality(self, bubbles, wave_interval):
+        self.bubbles.resize(bubbles)
+        self.wave_interval = wave_interval
 
     def draw(self, screen):
-        screen.blit(self.gradient_surface, (0, 0))
-        self.draw_light_beams(screen)
-        self.draw_waves(screen)
-        self.update_bubbles()
-        self.draw_bubbles(screen)
-
-    def draw_waves(self, screen):
+        screen.blit(self.static_layer, (0, 0))
+        self.draw_animated(screen)
+
+    def tick(self):
+        # one game tick of animation, drawing only shows where things are
+        self.bubbles.update()
+        self.wave_tick += 1
+        if self.wave_tick >= self.wave_interval:
+            # skipped steps are made up so the waves keep the same speed
+            self.wave_phase = (self.wave_phase + self.wave_speed * self.wave_tick) % (2 * math.pi)
+            self.wave_tick = 0
+
+    def draw_animated(self, screen):
+        # returns the rects it touched so a dirty-rect renderer can restore them next frame
+        rects = [self.draw_waves(screen)]
+        rects.extend(self.bubbles.draw(screen))
+        return rects
+
+    def restore(self, screen, rect):
+        screen.blit(self.static_layer, rect, rect)
+
+    def render_wave(self, surface, phase):
         points = []
         for x in range(0, self.width, 5):
-            y = int(50 + self.wave_amplitude * math.sin(self.wave_frequency * x + self.wave_phase))
+            y = int(self.wave_level + self.wave_amplitude * math.sin(self.wave_frequency * x + phase))
             points.append((x, y))
-        self.wave_phase += self.wave_speed
-        wave_surface = py.Surface((self.width, 60), py.SRCALPHA)
         if len(points) > 1:
-            py.draw.aalines(wave_surface, WAVE_COLOUR, False, points)
-        screen.blit(wave_surface, (0, 0))
+            py.draw.aalines(surface, WAVE_COLOUR, False, points)
+
+    def draw_waves(self, screen):
+        frames = self.wave_frames
+        index = round(self.wave_phase / (2 * math.pi) * len(frames)) % len(frames)
+        frame = frames[index]
+        if frame is None:
+            # drawn at screen coordinates and then cropped, aalines shading shifts if the line is translated
+            strip = py.Surface((self.width, self.wave_height), py.SRCALPHA)
+            self.render_wave(strip, 2 * math.pi * index / len(frames))
+            frame = strip.subsurface((0, self.wave_top, self.width, self.wave_height - self.wave_top)).copy()
+            frames[index] = frame
+        return screen.blit(frame, (0, self.wave_top))
 
     def draw_light_beams(self, screen):
         beam_surface = py.Surface((self.width, self.height), py.SRCALPHA)
         beam_positions = [self.width * 0.2, self.width * 0.5, self.width * 0.8]
         for pos in beam_positions:
-            beam_width = 100
+            beam_width = 100 * self.scale
             points = [
                 (pos - beam_width * 0.5, 0),
                 (pos + beam_width * 0.5, 0),
@@ -441,26 +962,447 @@ class OceanBackground:
             py.draw.polygon(beam_surface, BEAM_COLOUR, points)
         screen.blit(beam_surface, (0, 0))
 
-    def draw_bubbles(self, screen):
-        for bubble in self.bubbles:
-            py.draw.circle(screen, BUBBLE_COLOUR, (int(bubble['x']), int(bubble['y'])), bubble['radius'], 2)
+    def draw_coral(self, screen):
+        coral_surface = py.Surface((self.width, self.height), py.SRCALPHA)
+        for shape in CORAL_SHAPES:
+            py.draw.polygon(coral_surface, CORAL_COLOUR, [(x * self.scale, y * self.scale) for x, y in shape])
+        screen.blit(coral_surface, (0, 0))
+
+
+class EntityPool:
+    # live entities are packed into self.live, released ones wait in self.free (one list per class) to be reused
+    def __init__(self):
+        self.live = []
+        self.free = {}
+        self.created = 0
+
+    def acquire(self, entity_class, *args):
+        free = self.free.get(entity_class)
+        if free:
+            entity = free.pop()
+            entity.reset(*args)
+        else:
+            entity = entity_class(*args)
+            entity.generation = 0
+            self.created += 1
+        entity.slot = len(self.live)
+        entity.alive = True
+        self.live.append(entity)
+        return entity
+
+    def release(self, entity):
+        # O(1) swap-remove, the last live entity moves into the freed slot
+        last = self.live.pop()
+        if last is not entity:
+            self.live[entity.slot] = last
+            last.slot = entity.slot
+        entity.alive = False
+        # anyone holding (entity, generation) can tell the entity has since been reused
+        entity.generation += 1
+        self.free.setdefault(type(entity), []).append(entity)
+
+    def clear(self):
+        # cleared in place so references to self.live stay valid
+        for entity in self.live:
+            entity.alive = False
+            entity.generation += 1
+            self.free.setdefault(type(entity), []).append(entity)
+        self.live.clear()
+
+    def stats(self):
+        return {"live": len(self.live), "free": sum(len(free) for free in self.free.values()), "created": self.created}
+
+
+class DirtyRectRenderer:
+    # only repaints and uploads the regions that changed since the last frame
+    def __init__(self, screen, background, max_fraction=DIRTY_RECT_MAX_FRACTION):
+        self.screen = screen
+        self.background = background
+        self.screen_rect = screen.get_rect()
+        self.max_area = self.screen_rect.width * self.screen_rect.height * max_fraction
+        self.old_rects = []
+        self.full_redraw = True
+        self.full_flips = 0
+        self.partial_updates = 0
+
+    def invalidate(self):
+        self.full_redraw = True
+
+    def draw(self, queue, profiler=None, overlay=None):
+        if self.full_redraw:
+            self.screen.blit(self.background.static_layer, (0, 0))
+        else:
+            # wipe last frame's sprites, bubbles, waves and text with the cached background
+            for rect in self.old_rects:
+                self.background.restore(self.screen, rect)
+
+        new_rects = self.background.draw_animated(self.screen)
+        if profiler is not None:
+            profiler.mark("background")
+        new_rects.extend(queue.flush(self.screen, True))
+        if profiler is not None:
+            queue.report(profiler)
+            profiler.mark("blits")
+        if overlay is not None:
+            new_rects.append(overlay(self.screen))
+
+        dirty = [rect for rect in self.old_rects + new_rects if rect.width and rect.height]
+        area = 0
+        for rect in dirty:
+            area += rect.width * rect.height
+        if self.full_redraw or area > self.max_area:
+            py.display.flip()
+            self.full_flips += 1
+        else:
+            py.display.update(dirty)
+            self.partial_updates += 1
+        if profiler is not None:
+            profiler.mark("flip")
+        self.old_rects = new_rects
+        self.full_redraw = False
+
+    def stats(self):
+        return {"full_flips": self.full_flips, "partial_updates": self.partial_updates}
+
+
+class TextCache:
+    # font.render only runs the first time a (string, colour) pair is seen, the HUD changes a few times a second
+    def __init__(self, font, max_size=TEXT_CACHE_SIZE):
+        self.font = font
+        self.max_size = max_size
+        self.surfaces = {}
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text, colour=TEXT_COLOUR):
+        key = (text, colour)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            return surface
+        self.misses += 1
+        if len(self.surfaces) >= self.max_size:
+            # the score only goes up, so the oldest strings are the ones that won't come back
+            del self.surfaces[next(iter(self.surfaces))]
+        surface = self.font.render(text, True, colour)
+        self.surfaces[key] = surface
+        return surface
+
+    def stats(self):
+        return {"surfaces": len(self.surfaces), "hits": self.hits, "misses": self.misses}
+
+
+class KeyState:
+    # stands in for py.key.get_pressed() when the input comes from a script
+    def __init__(self, pressed=()):
+        self.pressed = set(pressed)
+
+    def __getitem__(self, key):
+        return key in self.pressed
+
+
+class AssetCache:
+    # loads and converts every image once, sprites then share the same Surface
+    # (index path, index mtime, converted) -> {name: subsurface}, or None when the atlas was out of date, shared by
+    # every cache so each atlas is checked and decoded once per process
+    atlases = {}
+
+    def __init__(self):
+        self.images = {}
+        # the atlases key whose sprites are in images
+        self.atlas = None
+        # collision masks made from the images' alpha, shared the same way
+        self.masks = {}
+        # (name, other) -> hit table, see get_hit_table
+        self.hit_tables = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, name):
+        self.misses += 1
+        img = py.image.load(name)
+        # simulation-only games never open a display, their sprites are only used for masks
+        if py.display.get_surface() is not None:
+            img = img.convert_alpha()
+        self.images[name] = img
+        return img
+
+    def load_atlas(self, index_path):
+        # every sprite becomes a subsurface of the one atlas image, returns False if there is no up to date atlas
+        try:
+            key = (index_path, os.path.getmtime(index_path), py.display.get_surface() is not None)
+        except OSError:
+            return False
+        if key == self.atlas:
+            return True
+        if key not in AssetCache.atlases:
+            AssetCache.atlases[key] = self.decode_atlas(index_path)
+        sprites = AssetCache.atlases[key]
+        if sprites is None:
+            return False
+        for name, img in sprites.items():
+            self.images[name] = img
+            self.masks.pop(name, None)
+        self.hit_tables = {}
+        self.atlas = key
+        return True
+
+    def decode_atlas(self, index_path):
+        try:
+            with open(index_path) as file:
+                index = json.load(file)
+            image_path = os.path.join(os.path.dirname(index_path), index["image"])
+            built = os.path.getmtime(image_path)
+        except (OSError, ValueError, KeyError):
+            return None
+        # a sprite edited since the last build would otherwise be shown out of date
+        for name in index["sprites"]:
+            if os.path.exists(name) and os.path.getmtime(name) > built:
+                return None
+        self.misses += 1
+        atlas = py.image.load(image_path)
+        if py.display.get_surface() is not None:
+            atlas = atlas.convert_alpha()
+        return {name: atlas.subsurface(rect) for name, rect in index["sprites"].items()}
+
+    def preload(self, names):
+        for name in names:
+            if name not in self.images:
+                self.load(name)
+
+    def get(self, name):
+        img = self.images.get(name)
+        if img is None:
+            return self.load(name)
+        self.hits += 1
+        return img
+
+    def get_mask(self, name):
+        # made the first time a sprite of this image is created
+        mask = self.masks.get(name)
+        if mask is None:
+            mask = py.mask.from_surface(self.get(name))
+            self.masks[name] = mask
+        return mask
+
+    def get_hit_table(self, name, other):
+        # every offset at which other's mask touches name's, as (table, width, origin), other's pixels placed at
+        # (dx, dy) from name's touch when table[origin + dy * width + dx] is non-zero, for any dx, dy where the two
+        # images' rects overlap
+        # one convolution when first asked for, then the narrow phase is a lookup instead of a mask test per pair
+        table = self.hit_tables.get((name, other))
+        if table is None:
+            other_mask = self.get_mask(other)
+            offsets = self.get_mask(name).convolve(other_mask)
+            width = offsets.get_size()[0]
+            surface = offsets.to_surface(setcolor=(255, 255, 255, 255), unsetcolor=(0, 0, 0, 0))
+            other_width, other_height = other_mask.get_size()
+            origin = (other_height - 1) * width + other_width - 1
+            table = (py.image.tobytes(surface, "RGBA")[3::4], width, origin)
+            self.hit_tables[name, other] = table
+        return table
+
+    def clear(self):
+        self.images = {}
+        self.atlas = None
+        self.masks = {}
+        self.hit_tables = {}
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {"images": len(self.images), "masks": len(self.masks), "hit_tables": len(self.hit_tables),
+                "hits": self.hits, "misses": self.misses}
 
 
 # SUBPROGRAMS
 # for OceanBackground
 def create_gradient_surface(width, height, top_colour, bottom_colour):
+    # loaded from disk after the first launch with the same size and colours
+    name = "gradient_{}x{}_{}.bmp".format(width, height, "_".join(str(c) for c in (*top_colour, *bottom_colour)))
+    path = os.path.join(CACHE_DIR, name)
+    gradient = None
+    if os.path.exists(path):
+        try:
+            gradient = py.image.load(path)
+        except py.error:
+            gradient = None
+    if gradient is None or gradient.get_size() != (width, height):
+        gradient = build_gradient_surface(width, height, top_colour, bottom_colour)
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            py.image.save(gradient, path)
+        except (OSError, py.error):
+            pass
+    if py.display.get_surface() is not None:
+        gradient = gradient.convert()
+    return gradient
+
+
+def build_gradient_surface(width, height, top_colour, bottom_colour):
+    # one row of colours worked out as an array, same rounding as int() per channel, then copied across
+    factor = np.arange(height) / height
+    top = np.array(top_colour, dtype=np.float64)
+    bottom = np.array(bottom_colour, dtype=np.float64)
+    column = (top + factor[:, None] * (bottom - top)).astype(np.uint8)
     gradient = py.Surface((width, height))
-    for y in range(height):
-        factor = y / height
-        red = int(top_colour[0] + factor * (bottom_colour[0] - top_colour[0]))
-        green = int(top_colour[1] + factor * (bottom_colour[1] - top_colour[1]))
-        blue = int(top_colour[2] + factor * (bottom_colour[2] - top_colour[2]))
-        py.draw.line(gradient, (red, green, blue), (0, y), (width, y))
+    py.surfarray.blit_array(gradient, np.broadcast_to(column, (width, height, 3)))
     return gradient
 
 
+def coral_rects():
+    # bounding boxes of the coral, the cells the flow field treats as blocked
+    rects = []
+    for shape in CORAL_SHAPES:
+        xs = [x for x, y in shape]
+        ys = [y for x, y in shape]
+        rects.append(py.Rect(min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys)))
+    return rects
+
+
+# waves
+def load_waves(path):
+    # see the comment in waves.json for the format
+    with open(path) as file:
+        waves = json.load(file)
+    for key in ("repeat", "spawns", "difficulty"):
+        waves.setdefault(key, [])
+    return waves
+
+
+def seconds_to_ticks(seconds):
+    return round(seconds * FPS)
+
+
+# fonts
+def find_font(name):
+    # py.font.SysFont searches every installed font each call, the path it finds is kept in the cache dir instead
+    cache_path = os.path.join(CACHE_DIR, FONT_CACHE)
+    try:
+        with open(cache_path) as file:
+            paths = json.load(file)
+    except (OSError, ValueError):
+        paths = {}
+    if paths.get(name) and os.path.exists(paths[name]):
+        return paths[name]
+    path = py.font.match_font(name)
+    if path is None:
+        # not cached, so a font installed later is found on the next launch
+        return None
+    paths[name] = path
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(cache_path, "w") as file:
+            json.dump(paths, file)
+    except OSError:
+        pass
+    return path
+
+
+def load_font(size):
+    # a None path is pygame's own bundled font, the same fallback SysFont uses
+    path = FONT_FILE if os.path.exists(FONT_FILE) else find_font(FONT_NAME)
+    return py.font.Font(path, size)
+
+
+# for drawing between ticks
+def lerp_pos(sprite, alpha):
+    if alpha >= 1.0:
+        return sprite.rect
+    return (sprite.prev_x + (sprite.rect.x - sprite.prev_x) * alpha,
+            sprite.prev_y + (sprite.rect.y - sprite.prev_y) * alpha)
+
+
+# for headless runs
+def load_input_script(path):
+    # each line is "<frames> [up] [down] [left] [right] [space]", space fires once at the start of the line
+    with open(path) as file:
+        lines = file.readlines()
+    for line in lines:
+        words = line.split("#")[0].split()
+        if not words:
+            continue
+        keys = KeyState(SCRIPT_KEYS[word] for word in words[1:] if word != "space")
+        shots = 1 if "space" in words[1:] else 0
+        for frame in range(int(words[0])):
+            yield keys, shots if frame == 0 else 0
+
+
+def bot_inputs():
+    # default headless input, sweeps up and down the screen and fires whenever ammo is likely back
+    up = KeyState([py.K_UP])
+    down = KeyState([py.K_DOWN])
+    frame = 0
+    while True:
+        keys = up if (frame // (2 * FPS)) % 2 else down
+        yield keys, 1 if frame % FPS == 0 else 0
+        frame += 1
+
+
+# shared between every sprite, filled by Game.__init__ once the display exists
+assets = AssetCache()
+
+
 # MAIN
 if __name__ == '__main__':
-    game = Game()
-    game.start_screen()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dirty-rects", action="store_true", help="only redraw and upload changed regions")
+    parser.add_argument("--brute-force-collisions", action="store_true",
+                        help="check every enemy instead of using the spatial hash")
+    parser.add_argument("--numpy-enemies", action="store_true", help="keep enemies in numpy arrays for huge waves")
+    parser.add_argument("--rect-collisions", action="store_true",
+                        help="hit on the sprites' whole bounding boxes instead of their visible pixels")
+    parser.add_argument("--flow-field", action="store_true",
+                        help="steer enemies round the coral with one shared flow field")
+    parser.add_argument("--profile", action="store_true", help="start with the frame profiler overlay on (F3)")
+    parser.add_argument("--quality", type=int, choices=range(len(QUALITY_LEVELS)),
+                        help="pin the quality level (0 is full) instead of adapting it to frame times")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print how long imports, init and loading took up to the first frame")
+    parser.add_argument("--wave-frames", type=int, default=WAVE_FRAMES,
+                        help="wave animation frames kept in memory, fewer saves memory but looks choppier")
+    parser.add_argument("--waves", default=WAVES_FILE, help="enemy wave definitions, see waves.json")
+    parser.add_argument("--record", help="save this run's inputs and seed to a replay file")
+    parser.add_argument("--replay", help="play a replay file back, uncapped when --headless")
+    parser.add_argument("--headless", action="store_true", help="simulate without a window or frame cap")
+    parser.add_argument("--seed", type=int, help="seed for enemy spawns and bubbles")
+    parser.add_argument("--frames", type=int, default=HEADLESS_FRAMES, help="frames to simulate when headless")
+    parser.add_argument("--script", help="input script for headless runs, a bot plays if not given")
+    args = parser.parse_args()
+    if args.wave_frames < 1:
+        parser.error("--wave-frames must be at least 1")
+    inputs = None
+    if args.replay:
+        args.seed, fps, flags, waves_crc, masks = load_replay(args.replay)
+        if fps != FPS:
+            print(f"warning: replay was recorded at {fps} ticks/s, the game now runs at {FPS}")
+        # the file isn't stored, only its checksum, so the same --waves has to be given again
+        if waves_crc != file_crc(args.waves):
+            print(f"warning: replay was recorded with a different waves file than {args.waves}, "
+                  f"it will play out differently")
+        args.numpy_enemies = bool(flags & NUMPY_ENEMIES)
+        args.flow_field = bool(flags & FLOW_FIELD)
+        args.rect_collisions = bool(flags & RECT_COLLISIONS)
+        inputs = replay_inputs(masks)
+    timeline = None
+    if args.profile_startup:
+        timeline = StartupTimeline(STARTED)
+        timeline.mark("imports", IMPORTED)
+    # the start screen shows before sprites and the background are loaded
+    game = Game(dirty_rects=args.dirty_rects, brute_force_collisions=args.brute_force_collisions,
+                numpy_enemies=args.numpy_enemies, headless=args.headless, seed=args.seed,
+                profile=args.profile, record=args.record, wave_frames=args.wave_frames,
+                quality=args.quality, defer_gameplay=not args.headless and inputs is None, timeline=timeline,
+                waves=args.waves, flow_field=args.flow_field, rect_collisions=args.rect_collisions)
+    if args.headless:
+        if inputs is None:
+            inputs = load_input_script(args.script) if args.script else bot_inputs()
+        result = game.run_headless(inputs, None if args.replay else args.frames)
+        print(f"simulated {result['frames']} frames in {result['seconds']:.3f} s "
+              f"({result['fps']:.0f} frames/s), score {result['score']}, health {result['health']}")
+        py.quit()
+    elif inputs is not None:
+        game.run(SCENE_PLAY, inputs)
+    else:
+        game.run()
 
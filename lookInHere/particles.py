@@ -0,0 +1,90 @@
+# IMPORTS
+import numpy as np
+import pygame as py
+
+# CONSTANTS
+OUTLINE_WIDTH = 2
+
+
+# CLASSES
+class ParticleSystem:
+    # struct-of-arrays particles rising at a constant speed, each one is respawned below the screen once it leaves
+    # the top, one numpy step moves them all and one Surface.blits call draws them
+    def __init__(self, count, width, height, colour, radii=(3, 8), speeds=(0.5, 1.5), margin=50, seed=None):
+        self.width = width
+        self.height = height
+        self.radii = radii
+        self.speeds = speeds
+        self.margin = margin
+        self.rng = np.random.default_rng(seed)
+        # index is the radius, every radius a particle can have is rendered up front
+        self.sprites = [circle_sprite(radius, colour) for radius in range(radii[1] + 1)]
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        self.radius = np.zeros(0, dtype=np.int64)
+        self.speed = np.zeros(0)
+        self.resize(count)
+
+    def __len__(self):
+        return len(self.x)
+
+    def random_x(self, count):
+        return self.rng.integers(self.margin, self.width - self.margin, count, endpoint=True).astype(np.float64)
+
+    def random_radius(self, count):
+        return self.rng.integers(self.radii[0], self.radii[1], count, endpoint=True)
+
+    def random_speed(self, count):
+        return self.rng.uniform(self.speeds[0], self.speeds[1], count)
+
+    def resize(self, count):
+        # new particles start near the bottom of the screen, removing keeps the oldest ones
+        old = len(self.x)
+        if count <= old:
+            self.x = self.x[:count]
+            self.y = self.y[:count]
+            self.radius = self.radius[:count]
+            self.speed = self.speed[:count]
+            return
+        added = count - old
+        self.x = np.concatenate((self.x, self.random_x(added)))
+        self.y = np.concatenate((self.y, self.rng.integers(self.height - 100, self.height - 10, added,
+                                                           endpoint=True).astype(np.float64)))
+        self.radius = np.concatenate((self.radius, self.random_radius(added)))
+        self.speed = np.concatenate((self.speed, self.random_speed(added)))
+
+    def update(self):
+        self.y -= self.speed
+        gone = np.flatnonzero(self.y + self.radius < 0)
+        if len(gone):
+            # everything that left this frame is respawned in one batch
+            count = len(gone)
+            self.x[gone] = self.random_x(count)
+            self.y[gone] = self.height + self.rng.integers(5, 50, count, endpoint=True)
+            self.radius[gone] = self.random_radius(count)
+            self.speed[gone] = self.random_speed(count)
+
+    def draw(self, screen):
+        # returns the rects drawn, particles still below the screen are skipped
+        top = (self.y - self.radius).astype(np.int64)
+        visible = np.flatnonzero(top < self.height)
+        if not len(visible):
+            return []
+        left = (self.x[visible] - self.radius[visible]).astype(np.int64)
+        sprites = self.sprites
+        sequence = [(sprites[radius], (x, y))
+                    for radius, x, y in zip(self.radius[visible].tolist(), left.tolist(), top[visible].tolist())]
+        return screen.blits(sequence, True)
+
+
+# SUBPROGRAMS
+def circle_sprite(radius, colour, width=OUTLINE_WIDTH):
+    # the same ring py.draw.circle would draw, centred on a colour-keyed surface, which blits far faster than
+    # per-pixel alpha since the ring is fully opaque
+    surface = py.Surface((radius * 2 + 1, radius * 2 + 1))
+    key = (0, 0, 0) if colour[:3] != (0, 0, 0) else (255, 0, 255)
+    surface.fill(key)
+    if radius:
+        py.draw.circle(surface, colour, (radius, radius), radius, min(width, radius))
+    surface.set_colorkey(key, py.RLEACCEL)
+    return surface
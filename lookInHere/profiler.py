@@ -0,0 +1,102 @@
+# IMPORTS
+import time
+from collections import deque
+import pygame as py
+
+# CONSTANTS
+PANEL_COLOUR = (0, 0, 0, 170)
+GRAPH_COLOUR = (0, 255, 0)
+BUDGET_COLOUR = (255, 80, 80)
+BAR_COLOUR = (255, 200, 0)
+TEXT_COLOUR = (255, 255, 255)
+PANEL_WIDTH = 240
+GRAPH_HEIGHT = 60
+ROW_HEIGHT = 14
+
+
+# CLASSES
+class FrameProfiler:
+    # lap timer for the phases of a frame, mark(phase) adds the time since the previous mark to that phase
+    def __init__(self, phases, budget_ms, window=120):
+        self.phases = phases
+        self.budget_ms = budget_ms
+        self.history = {phase: deque(maxlen=window) for phase in phases}
+        self.frames = deque(maxlen=window)
+        self.current = dict.fromkeys(phases, 0.0)
+        # plain numbers reported alongside the timings, e.g. blit counts, latest value wins
+        self.counters = {}
+        self.lap = time.perf_counter()
+
+    def begin_frame(self):
+        for phase in self.current:
+            self.current[phase] = 0.0
+        self.lap = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.current[phase] += (now - self.lap) * 1000
+        self.lap = now
+
+    def count(self, name, value):
+        self.counters[name] = value
+
+    def skip(self):
+        # leaves the time since the last mark out of every phase
+        self.lap = time.perf_counter()
+
+    def end_frame(self):
+        total = 0.0
+        for phase, ms in self.current.items():
+            self.history[phase].append(ms)
+            total += ms
+        self.frames.append(total)
+
+    def averages(self):
+        return {phase: sum(values) / len(values) if values else 0.0 for phase, values in self.history.items()}
+
+    def draw(self, screen, font):
+        # rolling frame time graph with a budget line, then one bar per phase, returns the area it covered
+        height = GRAPH_HEIGHT + ROW_HEIGHT * (len(self.phases) + 1 + bool(self.counters)) + 8
+        panel = py.Surface((PANEL_WIDTH, height), py.SRCALPHA)
+        panel.fill(PANEL_COLOUR)
+
+        scale = GRAPH_HEIGHT / (self.budget_ms * 2)
+        budget_y = GRAPH_HEIGHT - int(self.budget_ms * scale)
+        py.draw.line(panel, BUDGET_COLOUR, (0, budget_y), (PANEL_WIDTH, budget_y))
+        if len(self.frames) > 1:
+            step = PANEL_WIDTH / (self.frames.maxlen - 1)
+            points = [(int(i * step), GRAPH_HEIGHT - min(GRAPH_HEIGHT, int(ms * scale)))
+                      for i, ms in enumerate(self.frames)]
+            py.draw.lines(panel, GRAPH_COLOUR, False, points)
+
+        y = GRAPH_HEIGHT + 4
+        last = self.frames[-1] if self.frames else 0.0
+        panel.blit(font.render(f"frame {last:.2f} ms / {self.budget_ms:.1f} ms", True, TEXT_COLOUR), (4, y))
+        for phase, ms in self.averages().items():
+            y += ROW_HEIGHT
+            width = min(PANEL_WIDTH - 130, int((PANEL_WIDTH - 130) * ms / self.budget_ms))
+            py.draw.rect(panel, BAR_COLOUR, (126, y + 3, max(1, width), ROW_HEIGHT - 6))
+            panel.blit(font.render(f"{phase} {ms:.2f}", True, TEXT_COLOUR), (4, y))
+        if self.counters:
+            y += ROW_HEIGHT
+            counters = ", ".join(f"{name} {value}" for name, value in self.counters.items())
+            panel.blit(font.render(counters, True, TEXT_COLOUR), (4, y))
+        return screen.blit(panel, (0, screen.get_height() - height))
+
+
+class StartupTimeline:
+    # wall clock marks from process start to the first frame, printed as a table
+    def __init__(self, start):
+        self.start = start
+        self.marks = []
+
+    def mark(self, label, when=None):
+        self.marks.append((label, time.perf_counter() if when is None else when))
+
+    def report(self):
+        lines = []
+        previous = self.start
+        for label, when in self.marks:
+            lines.append(f"{(when - self.start) * 1000:8.1f} ms  +{(when - previous) * 1000:7.1f} ms  {label}")
+            previous = when
+        return "\n".join(lines)
@@ -0,0 +1,47 @@
+# IMPORTS
+from collections import deque
+
+# CONSTANTS
+WINDOW = 30
+# the rolling average has to drop below this fraction of the budget before quality goes back up
+HEADROOM = 0.5
+# frames to wait after a change so the new level's frame times are what gets measured
+HOLD_FRAMES = 60
+
+
+# CLASSES
+class QualityGovernor:
+    # watches rolling frame time, level 0 is full quality and each level above it sheds more work
+    def __init__(self, budget_ms, levels, window=WINDOW, headroom=HEADROOM, hold=HOLD_FRAMES):
+        self.budget_ms = budget_ms
+        self.levels = levels
+        self.headroom = headroom
+        self.hold = hold
+        self.samples = deque(maxlen=window)
+        self.level = 0
+        self.wait = hold
+        self.changes = 0
+
+    def update(self, frame_ms):
+        # returns True when the level changed
+        self.samples.append(frame_ms)
+        if self.wait:
+            self.wait -= 1
+            return False
+        if len(self.samples) < self.samples.maxlen:
+            return False
+        average = sum(self.samples) / len(self.samples)
+        if average > self.budget_ms and self.level < self.levels - 1:
+            self.level += 1
+        elif average < self.budget_ms * self.headroom and self.level > 0:
+            self.level -= 1
+        else:
+            return False
+        self.samples.clear()
+        self.wait = self.hold
+        self.changes += 1
+        return True
+
+    def stats(self):
+        average = sum(self.samples) / len(self.samples) if self.samples else 0.0
+        return {"level": self.level, "frame_ms": average, "changes": self.changes}
@@ -0,0 +1,97 @@
+# IMPORTS
+import pygame as py
+
+# CONSTANTS
+SCALED_CACHE_SIZE = 256
+
+
+# CLASSES
+class RenderQueue:
+    # draws are bucketed by layer and then by texture, flush() hands the whole frame to one Surface.blits call
+    def __init__(self, width, height, layers):
+        self.width = width
+        self.height = height
+        self.layers = [{} for _ in range(layers)]
+        self.sequence = []
+        self.blit_count = 0
+        self.draw_calls = 0
+        self.textures = 0
+        self.culled = 0
+        # below 1 draws go to a smaller canvas, textures are shrunk once and cached
+        self.scale = 1
+        self.scaled = {}
+
+    def set_scale(self, scale):
+        # culling stays in screen coordinates, only what is drawn is scaled
+        self.scale = scale
+        self.scaled.clear()
+
+    def scaled_image(self, img):
+        scaled = self.scaled.get(img)
+        if scaled is None:
+            if len(self.scaled) >= SCALED_CACHE_SIZE:
+                self.scaled.clear()
+            width, height = img.get_size()
+            scaled = py.transform.scale(img, (max(1, round(width * self.scale)), max(1, round(height * self.scale))))
+            self.scaled[img] = scaled
+        return scaled
+
+    def clear(self):
+        # buckets are dropped every frame so textures that stop being drawn (old HUD text) are let go
+        for layer in self.layers:
+            layer.clear()
+        self.culled = 0
+
+    def add(self, layer, img, dest):
+        # dest is a Rect or an (x, y) pair, anything entirely off screen is culled here
+        x = dest[0]
+        y = dest[1]
+        width, height = img.get_size()
+        if x >= self.width or y >= self.height or x + width <= 0 or y + height <= 0:
+            self.culled += 1
+            return
+        if self.scale != 1:
+            img = self.scaled_image(img)
+            dest = (int(x * self.scale), int(y * self.scale))
+        bucket = self.layers[layer].get(img)
+        if bucket is None:
+            self.layers[layer][img] = [dest]
+        else:
+            bucket.append(dest)
+
+    def add_group(self, layer, img, dests):
+        # for positions that were already culled, e.g. by EnemySwarm
+        if self.scale != 1:
+            img = self.scaled_image(img)
+            dests = [(int(x * self.scale), int(y * self.scale)) for x, y in dests]
+        bucket = self.layers[layer].get(img)
+        if bucket is None:
+            self.layers[layer][img] = list(dests)
+        else:
+            bucket.extend(dests)
+
+    def flush(self, screen, rects=False):
+        # rects=True returns the drawn rects, which the dirty-rect renderer needs
+        sequence = self.sequence
+        sequence.clear()
+        textures = 0
+        for layer in self.layers:
+            for img, dests in layer.items():
+                if dests:
+                    textures += 1
+                    sequence.extend([(img, dest) for dest in dests])
+        self.blit_count = len(sequence)
+        self.textures = textures
+        self.draw_calls = 1 if sequence else 0
+        if not sequence:
+            return []
+        return screen.blits(sequence, rects)
+
+    def stats(self):
+        return {"draw_calls": self.draw_calls, "blits": self.blit_count, "textures": self.textures,
+                "culled": self.culled}
+
+    def report(self, profiler):
+        # copies the last flush's numbers into a FrameProfiler's counters
+        for name, value in self.stats().items():
+            profiler.count(name, value)
@@ -0,0 +1,86 @@
+# IMPORTS
+import struct
+import zlib
+import pygame as py
+
+# CONSTANTS
+MAGIC = b"SHRK"
+VERSION = 2
+# magic, version, seed, tick rate, flags, number of ticks, crc32 of the waves file
+HEADER = struct.Struct("<4sBqHBII")
+# one byte per tick: the four arrows, escape, then up to 7 shots in the top three bits
+ARROW_BITS = [(py.K_UP, 1), (py.K_DOWN, 2), (py.K_LEFT, 4), (py.K_RIGHT, 8)]
+ESCAPE_BIT = 16
+SHOTS_SHIFT = 5
+MAX_SHOTS = 7
+# flags
+NUMPY_ENEMIES = 1
+FLOW_FIELD = 2
+RECT_COLLISIONS = 4
+
+
+# CLASSES
+class MaskKeys:
+    # replays a recorded byte as if it were py.key.get_pressed()
+    def __init__(self, mask):
+        self.mask = mask
+
+    def __getitem__(self, key):
+        for arrow, bit in ARROW_BITS:
+            if key == arrow:
+                return bool(self.mask & bit)
+        return False
+
+
+class InputRecorder:
+    def __init__(self, seed, fps, flags=0, waves_crc=0):
+        self.seed = seed
+        self.fps = fps
+        self.flags = flags
+        self.waves_crc = waves_crc
+        self.masks = bytearray()
+
+    def record(self, keys, shots, escape=False):
+        mask = min(shots, MAX_SHOTS) << SHOTS_SHIFT
+        for arrow, bit in ARROW_BITS:
+            if keys[arrow]:
+                mask |= bit
+        if escape:
+            mask |= ESCAPE_BIT
+        self.masks.append(mask)
+
+    def save(self, path):
+        with open(path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, self.seed, self.fps, self.flags, len(self.masks), self.waves_crc))
+            file.write(zlib.compress(bytes(self.masks), 9))
+
+
+# SUBPROGRAMS
+def load_replay(path):
+    # returns (seed, fps, flags, waves_crc, masks)
+    # any other version was recorded by a game that played differently, so it is refused rather than replayed
+    with open(path, "rb") as file:
+        data = file.read()
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is not a version {VERSION} replay")
+    magic, version, seed, fps, flags, ticks, waves_crc = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} replay")
+    masks = zlib.decompress(data[HEADER.size:])
+    if len(masks) != ticks:
+        raise ValueError(f"{path} is truncated")
+    return seed, fps, flags, waves_crc, masks
+
+
+def file_crc(path):
+    with open(path, "rb") as file:
+        return zlib.crc32(file.read())
+
+
+def replay_inputs(masks):
+    # (keys, shots) per tick, like a headless input script, ending on the tick escape was pressed
+    keys = [MaskKeys(mask) for mask in range(ESCAPE_BIT)]
+    for mask in masks:
+        yield keys[mask & (ESCAPE_BIT - 1)], mask >> SHOTS_SHIFT
+        if mask & ESCAPE_BIT:
+            return
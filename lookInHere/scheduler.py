@@ -0,0 +1,54 @@
+# CONSTANTS
+# one lap of the wheel, 1024 ticks is a little over half a minute at 30 ticks a second
+WHEEL_SLOTS = 1024
+
+
+# CLASSES
+class TimerWheel:
+    # hashed timing wheel keyed by tick, events due in the current lap go straight into their slot and later ones
+    # wait in a list for their lap, which is moved into the wheel when that lap starts
+    # scheduling and firing are both O(1) per event however many are pending
+    def __init__(self, slots=WHEEL_SLOTS):
+        self.size = slots
+        self.slots = [[] for _ in range(slots)]
+        self.laps = {}
+        # the next tick advance() will fire
+        self.now = 0
+        self.pending = 0
+
+    def __len__(self):
+        return self.pending
+
+    def schedule(self, tick, event):
+        # events for a tick that has already fired go off on the next one
+        tick = max(tick, self.now)
+        lap = tick // self.size
+        if lap == self.now // self.size:
+            self.slots[tick % self.size].append(event)
+        else:
+            self.laps.setdefault(lap, []).append((tick, event))
+        self.pending += 1
+
+    def advance(self, tick):
+        # returns every event due up to and including tick, in tick order and then the order they were scheduled
+        fired = []
+        size = self.size
+        while self.now <= tick:
+            slot = self.now % size
+            if slot == 0:
+                for due, event in self.laps.pop(self.now // size, ()):
+                    self.slots[due % size].append(event)
+            bucket = self.slots[slot]
+            if bucket:
+                fired.extend(bucket)
+                self.slots[slot] = []
+            self.now += 1
+        self.pending -= len(fired)
+        return fired
+
+    def clear(self):
+        for bucket in self.slots:
+            bucket.clear()
+        self.laps.clear()
+        self.now = 0
+        self.pending = 0
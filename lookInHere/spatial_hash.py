@@ -0,0 +1,48 @@
+# CLASSES
+# uniform grid of cells, each cell lists the indices of the objects whose rect overlaps it
+class SpatialHash:
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def cell_range(self, rect):
+        size = self.cell_size
+        return (range(rect.left // size, (rect.right - 1) // size + 1),
+                range(rect.top // size, (rect.bottom - 1) // size + 1))
+
+    def rebuild(self, objects):
+        # objects are anything with a .rect, e.g. the game's enemies list
+        self.cells = {}
+        cells = self.cells
+        size = self.cell_size
+        for i, obj in enumerate(objects):
+            left, top, width, height = obj.rect
+            x0 = left // size
+            x1 = (left + width - 1) // size
+            y0 = top // size
+            y1 = (top + height - 1) // size
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    cell = cells.get((cx, cy))
+                    if cell is None:
+                        cells[(cx, cy)] = [i]
+                    else:
+                        cell.append(i)
+
+    def query(self, rect):
+        # indices come back in list order so the first hit matches a brute-force scan
+        xs, ys = self.cell_range(rect)
+        cells = self.cells
+        if len(xs) == 1 and len(ys) == 1:
+            # cells are filled in list order, so a single cell is already sorted
+            return cells.get((xs[0], ys[0]), [])
+        found = set()
+        for cx in xs:
+            for cy in ys:
+                cell = cells.get((cx, cy))
+                if cell:
+                    found.update(cell)
+        return sorted(found)
+
+    def clear(self):
+        self.cells = {}
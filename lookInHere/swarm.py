@@ -0,0 +1,218 @@
+# IMPORTS
+import numpy as np
+
+
+# CLASSES
+class EnemySwarm:
+    # struct-of-arrays enemy store, each per-frame step is one numpy operation over every enemy
+    def __init__(self, kinds, size, capacity=256, masks=None):
+        # kinds is a list of (img, health, v), an enemy's type is its index in that list
+        # masks, one per kind, give the opaque boxes the pixel tests in projectile_hits and collides start from
+        self.imgs = [kind[0] for kind in kinds]
+        self.masks = masks
+        # (left, top, right, bottom) of each kind's opaque pixels inside its image, empty masks get an empty box
+        self.bounds = None if masks is None else np.array([opaque_bounds(mask) for mask in masks], dtype=np.float64)
+        self.kind_health = np.array([kind[1] for kind in kinds], dtype=np.int32)
+        self.kind_v = np.array([kind[2] for kind in kinds], dtype=np.float64)
+        self.size = size
+        self.count = 0
+        self.pos = np.zeros((capacity, 2))
+        # positions before the last move, for drawing between ticks
+        self.prev = np.zeros((capacity, 2))
+        self.vel = np.zeros((capacity, 2))
+        self.health = np.zeros(capacity, dtype=np.int32)
+        self.kind = np.zeros(capacity, dtype=np.int8)
+        # id of a list of hit tables -> (that list, flat_tables result)
+        self.flat_cache = {}
+
+    def __len__(self):
+        return self.count
+
+    def grow(self, needed):
+        capacity = len(self.health)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ("pos", "prev", "vel", "health", "kind"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def spawn(self, kind, x, y):
+        self.spawn_many(np.array([kind]), np.array([x]), np.array([y]))
+
+    def spawn_many(self, kinds, xs, ys):
+        start = self.count
+        end = start + len(kinds)
+        self.grow(end)
+        self.pos[start:end, 0] = xs
+        self.pos[start:end, 1] = ys
+        self.prev[start:end] = self.pos[start:end]
+        self.vel[start:end] = 0
+        self.kind[start:end] = kinds
+        self.health[start:end] = self.kind_health[kinds]
+        self.count = end
+
+    def seek(self, player_pos, field=None):
+        # same steering as Enemy.move_towards_player, but positions stay as floats between frames
+        n = self.count
+        centres = self.pos[:n] + self.size / 2
+        delta = np.asarray(player_pos, dtype=np.float64) - centres
+        distance = np.hypot(delta[:, 0], delta[:, 1])
+        v = self.kind_v[self.kind[:n]]
+        scale = np.divide(v, distance, out=np.zeros(n), where=distance != 0)
+        np.multiply(delta, scale[:, None], out=self.vel[:n])
+        if field is not None:
+            # one lookup per enemy, those in cells without a direction keep the straight line
+            steer = field.sample_many(centres)
+            follow = steer.any(axis=1)
+            self.vel[:n][follow] = steer[follow] * v[follow, None]
+
+    def move(self):
+        self.prev[:self.count] = self.pos[:self.count]
+        self.pos[:self.count] += self.vel[:self.count]
+
+    def overlaps(self, boxes, opaque=False):
+        # rows are (left, top, right, bottom) boxes, columns are enemies, same edge rules as Rect.colliderect
+        # opaque tests against the box round each enemy's opaque pixels at its drawn, truncated position instead,
+        # pixels can only touch where those overlap so it rejects most pairs before the pixel tests
+        n = self.count
+        if opaque:
+            pos = np.trunc(self.pos[:n])
+            bounds = self.bounds[self.kind[:n]]
+            left, top = pos[:, 0] + bounds[:, 0], pos[:, 1] + bounds[:, 1]
+            right, bottom = pos[:, 0] + bounds[:, 2], pos[:, 1] + bounds[:, 3]
+        else:
+            left, top = self.pos[:n, 0], self.pos[:n, 1]
+            right, bottom = left + self.size, top + self.size
+        return ((boxes[:, 0:1] < right) & (boxes[:, 2:3] > left)
+                & (boxes[:, 1:2] < bottom) & (boxes[:, 3:4] > top))
+
+    def touching(self, boxes, rows, columns, tables):
+        # which of the (box row, enemy column) pairs touch pixel for pixel, tables are AssetCache hit tables of each
+        # kind against the image in the boxes, positions truncate to ints as they do when drawn
+        flat, origins, widths = self.flat_tables(tables)
+        kinds = self.kind[columns]
+        corner = boxes[rows, :2].astype(np.int64) - self.pos[columns].astype(np.int64)
+        return flat[origins[kinds] + corner[:, 1] * widths[kinds] + corner[:, 0]] != 0
+
+    def flat_tables(self, tables):
+        # the kinds' hit tables joined into one array, with where each kind's origin is in it and its width, so many
+        # pairs are tested with one lookup, made once per list of tables
+        cached = self.flat_cache.get(id(tables))
+        if cached is None or cached[0] is not tables:
+            starts = np.cumsum([0] + [len(table) for table, _, _ in tables[:-1]])
+            flat = (np.frombuffer(b"".join(table for table, _, _ in tables), dtype=np.uint8),
+                    starts + np.array([origin for _, _, origin in tables]),
+                    np.array([width for _, width, _ in tables]))
+            cached = self.flat_cache[id(tables)] = (tables, flat)
+        return cached[1]
+
+    def damage(self, indices, amount=1):
+        np.subtract.at(self.health, indices, amount)
+
+    def projectile_hits(self, rects, tables=None):
+        # each projectile damages the first enemy it touches, returns which projectiles hit
+        # with hit tables of each kind against the projectile, boxes are only the broad phase and a projectile stops
+        # at the first enemy whose pixels it touches
+        if not rects or not self.count:
+            return [False] * len(rects)
+        boxes = rect_boxes(rects)
+        overlap = self.overlaps(boxes, opaque=tables is not None)
+        hit = overlap.any(axis=1)
+        if tables is None:
+            self.damage(overlap.argmax(axis=1)[hit])
+            return hit.tolist()
+        # every projectile's first candidate is tested at once, opaque boxes that overlap nearly always mean a hit
+        rows = np.flatnonzero(hit)
+        candidates = overlap[rows]
+        first = candidates.argmax(axis=1)
+        touch = self.touching(boxes, rows, first, tables)
+        hit[rows[~touch]] = False
+        damaged = first[touch].tolist()
+        # the few that missed go on through the rest of their candidates, pairs come in projectile then enemy order
+        missed = np.flatnonzero(~touch)
+        candidates = candidates[missed]
+        candidates[np.arange(len(missed)), first[missed]] = False
+        pairs, columns = np.nonzero(candidates)
+        done = -1
+        for j, i, (left, top), kind in zip(pairs.tolist(), columns.tolist(),
+                                           self.pos[columns].astype(np.int64).tolist(), self.kind[columns].tolist()):
+            if j == done:
+                continue
+            p = rows[missed[j]]
+            rect = rects[p]
+            table, width, origin = tables[kind]
+            if table[origin + (rect.y - top) * width + rect.x - left]:
+                hit[p] = True
+                damaged.append(i)
+                done = j
+        self.damage(np.array(damaged, dtype=np.intp))
+        return hit.tolist()
+
+    def collides(self, rect, tables=None):
+        if not self.count:
+            return False
+        boxes = rect_boxes([rect])
+        overlap = self.overlaps(boxes, opaque=tables is not None)[0]
+        if tables is None:
+            return bool(overlap.any())
+        # one rect only has a few candidates, looping over them beats a round of numpy calls
+        x, y = rect.x, rect.y
+        columns = np.flatnonzero(overlap)
+        for (left, top), kind in zip(self.pos[columns].astype(np.int64).tolist(), self.kind[columns].tolist()):
+            table, width, origin = tables[kind]
+            if table[origin + (y - top) * width + x - left]:
+                return True
+        return False
+
+    def remove_dead(self):
+        n = self.count
+        alive = self.health[:n] > 0
+        if alive.all():
+            return
+        keep = np.flatnonzero(alive)
+        self.count = len(keep)
+        for name in ("pos", "prev", "vel", "health", "kind"):
+            array = getattr(self, name)
+            array[:self.count] = array[keep]
+
+    def step(self, player_pos, field=None):
+        self.seek(player_pos, field)
+        self.move()
+        self.remove_dead()
+
+    def blit_groups(self, width, height, alpha=1.0):
+        # integer positions are only produced here, for drawing, grouped by type with off-screen enemies culled
+        # alpha blends from the previous position, returns ([(img, positions), ...], culled)
+        n = self.count
+        pos = self.pos[:n]
+        if alpha < 1.0:
+            prev = self.prev[:n]
+            pos = prev + (pos - prev) * alpha
+        visible = ((pos[:, 0] < width) & (pos[:, 1] < height)
+                   & (pos[:, 0] > -self.size) & (pos[:, 1] > -self.size))
+        topleft = pos.astype(np.int64)
+        kinds = self.kind[:n]
+        groups = []
+        for kind, img in enumerate(self.imgs):
+            groups.append((img, topleft[visible & (kinds == kind)].tolist()))
+        return groups, n - int(visible.sum())
+
+    def clear(self):
+        self.count = 0
+
+
+# SUBPROGRAMS
+def rect_boxes(rects):
+    return np.array([(r.left, r.top, r.right, r.bottom) for r in rects], dtype=np.float64).reshape(-1, 4)
+
+
+def opaque_bounds(mask):
+    rects = mask.get_bounding_rects()
+    if not rects:
+        return 0, 0, 0, 0
+    box = rects[0].unionall(rects[1:])
+    return box.left, box.top, box.right, box.bottom
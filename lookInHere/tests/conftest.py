@@ -0,0 +1,12 @@
+# IMPORTS
+import os
+import sys
+
+# CONSTANTS
+# the game loads its assets relative to the working directory, so the checks run from lookInHere like the scripts do
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# MAIN
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
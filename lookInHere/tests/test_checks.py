@@ -0,0 +1,24 @@
+# IMPORTS
+import benchmark
+
+# CONSTANTS
+# short versions of the checks benchmark.py runs in full
+CHECK_TICKS = 120
+CHECK_ENEMIES = 100
+# enough restarts to get past the soak warmup
+SOAK_RESTARTS = benchmark.SOAK_WARMUP * 2
+SOAK_ENEMIES = 20
+
+
+# SUBPROGRAMS
+def test_grid_collisions_match_brute_force():
+    for seed in (0, 1):
+        result = benchmark.check_grid_collisions(CHECK_TICKS, CHECK_ENEMIES, seed)
+        assert result["mismatch"] is None, f"seed {seed} diverged at tick {result['mismatch']}"
+
+
+def test_restarts_do_not_leak():
+    for numpy_enemies in (False, True):
+        result = benchmark.soak_restarts(SOAK_RESTARTS, SOAK_ENEMIES, numpy_enemies)
+        assert not result["leaked"], (f"stack depth {result['stack_depth']}, "
+                                      f"traced memory grew {result['growth_kb']:.1f} KB")
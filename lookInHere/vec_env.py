@@ -0,0 +1,145 @@
+# IMPORTS
+import os
+import time
+import argparse
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import new_main as game
+from replay import MaskKeys, ESCAPE_BIT, SHOTS_SHIFT
+
+# CONSTANTS
+# enemy slots per observation, the nearest ones are kept when more are alive
+MAX_ENEMIES = 32
+# episodes still running after this many ticks are cut off and reset, five minutes of game time
+MAX_TICKS = 5 * 60 * game.FPS
+EMPTY_KIND = -1
+
+
+# CLASSES
+class VecEnv:
+    # n seeded headless games stepped in lockstep from a batch of actions, nothing is ever drawn
+    # observations are written into the same arrays every step, copy them to keep one past the next step
+    # an episode that ends is reset straight away, its final score is in info["score"]
+    def __init__(self, n, seed=0, max_enemies=MAX_ENEMIES, max_ticks=MAX_TICKS, numpy_enemies=False,
+                 waves=game.WAVES_FILE):
+        self.n = n
+        self.max_enemies = max_enemies
+        self.max_ticks = max_ticks
+        # game i uses seed + i, none of them has a display or anything else for drawing
+        self.games = [game.Game(seed=seed + i, numpy_enemies=numpy_enemies, waves=waves, simulate_only=True)
+                      for i in range(n)]
+        self.kind_index = {kind: i for i, kind in enumerate(self.games[0].enemy_kinds)}
+        self.keys = [MaskKeys(mask) for mask in range(ESCAPE_BIT)]
+        # observation
+        self.player = np.zeros((n, 2), dtype=np.float32)
+        self.health = np.zeros(n, dtype=np.int32)
+        self.ammo = np.zeros(n, dtype=np.int32)
+        self.enemies = np.zeros((n, max_enemies, 2), dtype=np.float32)
+        self.enemy_health = np.zeros((n, max_enemies), dtype=np.int32)
+        self.enemy_kind = np.full((n, max_enemies), EMPTY_KIND, dtype=np.int8)
+        self.enemy_count = np.zeros(n, dtype=np.int32)
+        self.observation = {"player": self.player, "health": self.health, "ammo": self.ammo,
+                            "enemies": self.enemies, "enemy_health": self.enemy_health,
+                            "enemy_kind": self.enemy_kind, "enemy_count": self.enemy_count}
+        # step results
+        self.rewards = np.zeros(n, dtype=np.float32)
+        self.terminated = np.zeros(n, dtype=bool)
+        self.truncated = np.zeros(n, dtype=bool)
+        self.scores = np.zeros(n, dtype=np.int32)
+        self.ticks = np.zeros(n, dtype=np.int64)
+        self.info = {"score": self.scores, "ticks": self.ticks}
+
+    def reset(self, seed=None):
+        # a seed restarts every game's random state as seed + i, otherwise each carries on from its last episode
+        for i, g in enumerate(self.games):
+            if seed is not None:
+                g.rng.seed(seed + i)
+            self.reset_game(i)
+        return self.observation
+
+    def reset_game(self, i):
+        self.games[i].reset()
+        self.ticks[i] = 0
+        self.observe(i)
+
+    def step(self, actions):
+        # an action is a replay byte, the four arrow bits then the shots in the top three bits, escape is ignored
+        # one tick of every game, returns (observation, rewards, terminated, truncated, info)
+        # the reward is the score gained this tick, the game scores one point per second survived
+        keys = self.keys
+        for i, g in enumerate(self.games):
+            action = int(actions[i])
+            score = g.score
+            alive = g.update(keys[action & (ESCAPE_BIT - 1)], action >> SHOTS_SHIFT)
+            self.ticks[i] += 1
+            self.rewards[i] = g.score - score
+            self.terminated[i] = not alive
+            self.truncated[i] = alive and self.ticks[i] >= self.max_ticks
+            if alive and not self.truncated[i]:
+                self.observe(i)
+                continue
+            self.scores[i] = g.score
+            self.reset_game(i)
+        return self.observation, self.rewards, self.terminated, self.truncated, self.info
+
+    def observe(self, i):
+        g = self.games[i]
+        player = g.player
+        self.player[i] = player.rect.topleft
+        self.health[i] = player.health
+        self.ammo[i] = player.ammo
+        if g.swarm is not None:
+            count = len(g.swarm)
+            positions = g.swarm.pos[:count]
+            health = g.swarm.health[:count]
+            kinds = g.swarm.kind[:count]
+        else:
+            enemies = g.enemies
+            count = len(enemies)
+            positions = np.array([enemy.rect.topleft for enemy in enemies], dtype=np.float32).reshape(-1, 2)
+            health = np.array([enemy.health for enemy in enemies], dtype=np.int32)
+            kinds = np.array([self.kind_index[type(enemy)] for enemy in enemies], dtype=np.int8)
+        if count > self.max_enemies:
+            distance = np.abs(positions - self.player[i]).sum(axis=1)
+            nearest = np.argpartition(distance, self.max_enemies - 1)[:self.max_enemies]
+            positions, health, kinds = positions[nearest], health[nearest], kinds[nearest]
+            count = self.max_enemies
+        self.enemies[i, :count] = positions
+        self.enemies[i, count:] = 0
+        self.enemy_health[i, :count] = health
+        self.enemy_health[i, count:] = 0
+        self.enemy_kind[i, :count] = kinds
+        self.enemy_kind[i, count:] = EMPTY_KIND
+        self.enemy_count[i] = count
+
+
+# SUBPROGRAMS
+def random_actions(rng, n):
+    # any arrows with one shot a tenth of the time
+    return rng.integers(0, ESCAPE_BIT, n) | ((rng.random(n) < 0.1) << SHOTS_SHIFT)
+
+
+# MAIN
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="step a batch of headless games with random actions and time it")
+    parser.add_argument("--envs", type=int, default=16)
+    parser.add_argument("--steps", type=int, default=2000, help="lockstep steps, each is one tick of every game")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-enemies", type=int, default=MAX_ENEMIES)
+    parser.add_argument("--numpy-enemies", action="store_true")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    env = VecEnv(args.envs, args.seed, args.max_enemies, numpy_enemies=args.numpy_enemies)
+    env.reset()
+    built = time.perf_counter() - start
+    rng = np.random.default_rng(args.seed)
+    episodes = 0
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        observation, rewards, terminated, truncated, info = env.step(random_actions(rng, args.envs))
+        episodes += int(terminated.sum() + truncated.sum())
+    seconds = time.perf_counter() - start
+    print(f"{args.envs} envs built in {built:.2f} s, {args.steps * args.envs} env-steps in {seconds:.2f} s "
+          f"({args.steps * args.envs / seconds:.0f} steps/s), {episodes} episodes finished")
@@ -2,6 +2,8 @@
 import pygame
 import math
 import random
+import os
+import numpy as np
 
 # some constants
 from pygame.locals import (
@@ -20,19 +22,45 @@ player_img = "fish.png"
 enemy_img = "shark.png"
 attack_img= "bubble.png"
 
+gradient_cache_dir = ".cache"
+
 def create_gradient_surface(width, height, top_colour, bottom_colour):
     """
     Create a surface with a vertical gradient from top_colour to bottom_colour.
+    The result is cached on disk, keyed by size and colours, so later launches just load it.
+    """
+    name = "gradient_{}x{}_{}.bmp".format(width, height, "_".join(str(c) for c in (*top_colour, *bottom_colour)))
+    path = os.path.join(gradient_cache_dir, name)
+    gradient = None
+    if os.path.exists(path):
+        try:
+            gradient = pygame.image.load(path)
+        except pygame.error:
+            gradient = None
+    if gradient is None or gradient.get_size() != (width, height):
+        gradient = build_gradient_surface(width, height, top_colour, bottom_colour)
+        try:
+            os.makedirs(gradient_cache_dir, exist_ok=True)
+            pygame.image.save(gradient, path)
+        except (OSError, pygame.error):
+            pass
+    if pygame.display.get_surface() is not None:
+        gradient = gradient.convert()
+    return gradient
+
+def build_gradient_surface(width, height, top_colour, bottom_colour):
+    """
+    Build the gradient as one array operation instead of a line per pixel row.
     """
+    # Interpolation factor for every row (0 at top; 1 at bottom)
+    factor = np.arange(height) / height
+    top = np.array(top_colour, dtype=np.float64)
+    bottom = np.array(bottom_colour, dtype=np.float64)
+    # astype truncates like int() did for each channel
+    column = (top + factor[:, None] * (bottom - top)).astype(np.uint8)
     gradient = pygame.Surface((width, height))
-    for y in range(height):
-        # Compute interpolation factor (0 at top; 1 at bottom)
-        factor = y / height
-        # Linearly interpolate each colour channel
-        red = int(top_colour[0] + factor * (bottom_colour[0] - top_colour[0]))
-        green = int(top_colour[1] + factor * (bottom_colour[1] - top_colour[1]))
-        blue = int(top_colour[2] + factor * (bottom_colour[2] - top_colour[2]))
-        pygame.draw.line(gradient, (red, green, blue), (0, y), (width, y))
+    # Every column of the surface is the same row of colours
+    pygame.surfarray.blit_array(gradient, np.broadcast_to(column, (width, height, 3)))
     return gradient
 
 class OceanBackground:
@@ -52,6 +80,15 @@ class OceanBackground:
         # Create bubbles
         self.bubbles = self.create_bubbles(15)  # Number of bubbles to draw
 
+        # Composite everything that never changes into one layer up front
+        # (the coral sits below the wave strip, so baking it first is safe)
+        self.static_layer = self.gradient_surface.copy()
+        self.draw_light_beams(self.static_layer)
+        self.draw_coral(self.static_layer)
+
+        # Reused every frame instead of allocating a new strip
+        self.wave_surface = pygame.Surface((width, 60), pygame.SRCALPHA)
+
     def create_bubbles(self, count):
         """
         Initialize a list of bubbles with random positions near the bottom.
@@ -82,18 +119,12 @@ class OceanBackground:
                 bubble['speed'] = random.uniform(0.5, 1.5)
 
     def draw(self, screen):
-        # Draw the static ocean gradient
-        screen.blit(self.gradient_surface, (0, 0))
-
-        # Draw animated light beams (soft beams are drawn first)
-        self.draw_light_beams(screen)
+        # Draw the pre-baked gradient, light beams and coral in one blit
+        screen.blit(self.static_layer, (0, 0))
 
         # Draw animated waves near the surface
         self.draw_waves(screen)
 
-        # Draw faint silhouettes of marine details (e.g., coral)
-        self.draw_coral(screen)
-
         # Update and draw bubbles
         self.update_bubbles()
         self.draw_bubbles(screen)
@@ -110,13 +141,13 @@ class OceanBackground:
         # Advance the phase for the next frame
         self.wave_phase += self.wave_speed
 
-        # Create a transparent surface to draw waves
-        wave_surface = pygame.Surface((self.width, 60), pygame.SRCALPHA)
+        # Clear the reusable transparent strip from the last frame
+        self.wave_surface.fill((0, 0, 0, 0))
         if len(points) > 1:
             # Draw the wave line
-            pygame.draw.aalines(wave_surface, WAVE_COLOUR, False, points)
+            pygame.draw.aalines(self.wave_surface, WAVE_COLOUR, False, points)
         # Blit the wave surface onto the screen (positioned near the top)
-        screen.blit(wave_surface, (0, 0))
+        screen.blit(self.wave_surface, (0, 0))
 
     def draw_light_beams(self, screen):
         """